@@ -1,100 +1,22 @@
-from flask import Flask, render_template, request, redirect, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, session, jsonify, g
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
-from werkzeug.utils import secure_filename
-import pandas as pd
 from datetime import datetime
+import db
+import metrics
+from db import get_db
+from metrics import timed
+from sales import SalesFileError, csv_path_for, ensure_ingested, ingest_sales_csv, last_30d_avg
 
 app = Flask(__name__)
 app.secret_key = 'feast_forward_nayab'
+db.init_app(app)
+metrics.init_app(app)
 
+# History tables on the dashboard show one page; older rows come from /history
+HISTORY_PAGE_SIZE = 20
+app.jinja_env.globals["HISTORY_PAGE_SIZE"] = HISTORY_PAGE_SIZE
 
-def get_db():
-    return sqlite3.connect('database.db')
-
-with get_db() as con:
-    cur = con.cursor()
-    cur.execute('''CREATE TABLE IF NOT EXISTS users(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS restaurants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS feature_settings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    restaurant_id INTEGER NOT NULL,
-                    grocery_management BOOLEAN DEFAULT 0,
-                    staff_management BOOLEAN DEFAULT 0,
-                    combo_creation BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (restaurant_id) REFERENCES restaurants(id) ON DELETE CASCADE
-                )''')
-    cur.execute("""CREATE TABLE IF NOT EXISTS predictions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    prediction_uid TEXT,
-                    restaurant_id INTEGER,
-                    menu_item TEXT,
-                    predicted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    servings INTEGER
-                )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS recipe_mapping (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    restaurant_id INTEGER NOT NULL,
-                    menu_item TEXT NOT NULL,
-                    ingredient_name TEXT NOT NULL,
-                    qty_per_serving REAL NOT NULL,
-                    unit TEXT NOT NULL,
-                    FOREIGN KEY (restaurant_id) 
-                    REFERENCES restaurants(id) 
-                    ON DELETE CASCADE
-                 )""")
-    cur.execute(""" CREATE TABLE IF NOT EXISTS staff_mapping (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    restaurant_id INTEGER NOT NULL,
-                    menu_item TEXT NOT NULL,
-                    base_servings INTEGER NOT NULL,
-                    cooks INTEGER NOT NULL,
-                    helpers INTEGER NOT NULL,
-                    cleaners INTEGER NOT NULL,
-                    FOREIGN KEY (restaurant_id)
-                        REFERENCES restaurants(id)
-                        ON DELETE CASCADE
-                )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS staff_predictions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        restaurant_id INTEGER,
-                        menu_item TEXT,
-                        predicted_servings INTEGER,
-                        cooks INTEGER,
-                        helpers INTEGER,
-                        cleaners INTEGER,
-                        calculated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS combos (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        restaurant_id INTEGER,
-                        combo_name TEXT,
-                        items TEXT,
-                        total_cost REAL,
-                        discount_percent REAL,
-                        final_price REAL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (restaurant_id)
-                            REFERENCES restaurants(id)
-                            ON DELETE CASCADE
-                    )""")
-
-
-            
-
-
-    con.commit()
 
 @app.route('/')
 def home():
@@ -129,9 +51,9 @@ def signup():
     if request.method == 'POST':
         data = request.form
         password = generate_password_hash(data['password'])
-        g = 1 if data.get('grocery') else 0
-        s = 1 if data.get('staff') else 0
-        c = 1 if data.get('combo') else 0
+        grocery = 1 if data.get('grocery') else 0
+        staff = 1 if data.get('staff') else 0
+        combo = 1 if data.get('combo') else 0
         try:
             with get_db() as con:
                 #in case error osthey comma check cheskovali
@@ -140,8 +62,9 @@ def signup():
                 uid = cur.lastrowid
                 cur.execute('''INSERT INTO restaurants(user_id,name) VALUES (?,?)''',(uid,data['restaurant']))
                 rid = cur.lastrowid
-                cur.execute('''INSERT INTO feature_settings(restaurant_id,grocery_management,staff_management,combo_creation) VALUES(?,?,?,?)''',(rid,g,s,c))
+                cur.execute('''INSERT INTO feature_settings(restaurant_id,grocery_management,staff_management,combo_creation) VALUES(?,?,?,?)''',(rid,grocery,staff,combo))
                 con.commit()
+            forget_restaurant_id(uid)
             return redirect('/login') 
         except: 
             # in case exception vasthe internal ga sqlite ye rollback chesthadi commit ni so you no need to worry 
@@ -153,147 +76,77 @@ def dashboard():
     if 'user_id' not in session:
         return redirect('/login')
 
-    uid = session['user_id']
+    restaurant_id = get_restaurant_id(session['user_id'])
 
-    with get_db() as con:
-        cur = con.cursor()
-
-        cur.execute("""
-            SELECT r.id, r.name,
-                   f.grocery_management,
-                   f.staff_management,
-                   f.combo_creation
-            FROM restaurants r
-            JOIN feature_settings f ON f.restaurant_id = r.id
-            WHERE r.user_id = ?
-        """, (uid,))
-        row = cur.fetchone()
-
-        if not row:
-            return "No restaurant found", 404
-
-        restaurant_id = row[0]
-
-
-        user = {
-            "restaurant_name": row[1]
-        }
-
-        services = {
-            "grocery": bool(row[2]),
-            "staff": bool(row[3]),
-            "combo": bool(row[4])
-        }
+    if restaurant_id is None:
+        return "No restaurant found", 404
 
-        cur.execute("""
-            SELECT menu_item, predicted_at, servings
-            FROM predictions
-            WHERE restaurant_id = ?
-            ORDER BY predicted_at DESC
-        """, (restaurant_id,))
-        predictions = cur.fetchall()
-
-    menu_items = get_trained_menu_items(restaurant_id)
-
-    recipe_exists = has_recipe_setup(restaurant_id)
-    staff_history = load_staff_history(restaurant_id)
-    combos = load_combos(restaurant_id)
-
-
-
-    return render_template(
-        'dashboard.html',
-        user=user,
-        services=services,
-        predictions=predictions,
-        staff_history=staff_history,
-        combos=combos,
-        menu_items=menu_items,
-        recipe_exists=recipe_exists,
-        auto_open_manage=False
-    )
-
-
-def has_recipe_setup(restaurant_id):
-    with get_db() as con:
-        cur = con.execute(
-            "SELECT COUNT(*) FROM recipe_mapping WHERE restaurant_id = ?",
-            (restaurant_id,)
-        )
-        count = cur.fetchone()[0]
-        return count > 0
+    return render_dashboard(restaurant_id)
 
 
 def get_trained_menu_items(restaurant_id):
-    base_path = f"ml/storage/user_{restaurant_id}"
-    if not os.path.exists(base_path):
-        return []
+    from ml.registry import trained_menu_items
 
-    return [
-        name for name in os.listdir(base_path)
-        if os.path.isdir(os.path.join(base_path, name))
-    ]
+    return trained_menu_items(restaurant_id)
+
+# user_id -> restaurant_id. A user's restaurant is fixed once signup
+# commits, so entries only need dropping when a user id is (re)created.
+_restaurant_ids = {}
 
 def get_restaurant_id(user_id):
+    if user_id in _restaurant_ids:
+        return _restaurant_ids[user_id]
+
     with get_db() as con:
         cur = con.execute(
             "SELECT id FROM restaurants WHERE user_id = ?",
             (user_id,)
         )
-        return cur.fetchone()[0]
-
-def get_last_30d_avg(restaurant_id, menu_item):
-    path = f"uploads/user_{restaurant_id}/{menu_item.lower().replace(' ', '_')}.csv"
-
-    if not os.path.exists(path):
-        return 0
+        row = cur.fetchone()
 
-    df = pd.read_csv(path)
+    if row is None:
+        return None
 
-    if "Date" not in df.columns or "no_of_servings" not in df.columns:
-        return 0
+    _restaurant_ids[user_id] = row[0]
+    return row[0]
 
-    df["Date"] = pd.to_datetime(df["Date"],format="%d-%m-%Y")
-    last_30 = df.sort_values("Date").tail(30)
+def forget_restaurant_id(user_id):
+    _restaurant_ids.pop(user_id, None)
 
-    return float(last_30["no_of_servings"].mean())
-def calculate_staff(base_servings, predicted_servings, cooks, helpers, cleaners):
-    if base_servings == 0:
-        return {
-            "cooks": 0,
-            "helpers": 0,
-            "cleaners": 0
-        }
-    multiplier = predicted_servings / base_servings
+def get_last_30d_avg(restaurant_id, menu_item):
+    with get_db() as con:
+        avg = last_30d_avg(con, restaurant_id, menu_item)
 
-    return {
-        "cooks": round(cooks * multiplier),
-        "helpers": round(helpers * multiplier),
-        "cleaners": round(cleaners * multiplier)
-    }
+        if avg is None and ensure_ingested(con, restaurant_id, menu_item):
+            avg = last_30d_avg(con, restaurant_id, menu_item)
 
+    return avg or 0
 
 def save_csv(restaurant_id, menu_item, csv_file):
-    base_dir = f"uploads/user_{restaurant_id}"
-    os.makedirs(base_dir, exist_ok=True)
+    path = csv_path_for(restaurant_id, menu_item)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-    filename = secure_filename(menu_item.lower().replace(" ", "_") + ".csv")
-    path = os.path.join(base_dir, filename)
+    # Only a CSV that ingests cleanly replaces the previous upload
+    upload_path = path + ".upload"
+    csv_file.save(upload_path)
 
-    csv_file.save(path)
-    return path
+    from ml.cache import result_cache
+    from ml.forecast import invalidate_forecasts
 
-def train_menu_item_model(restaurant_id, menu_item, csv_path):
-    from ml.train import train_and_save
+    try:
+        with get_db() as con, timed("ingest"):
+            ingest_sales_csv(con, restaurant_id, menu_item, upload_path)
+            invalidate_forecasts(con, restaurant_id, menu_item)
+            con.commit()
+    except Exception:
+        os.remove(upload_path)
+        raise
 
-    model_dir = f"ml/storage/user_{restaurant_id}/{menu_item}"
-    os.makedirs(model_dir, exist_ok=True)
+    result_cache.invalidate(restaurant_id, menu_item)
 
-    train_and_save(
-        menu_item=menu_item,
-        csv_path=csv_path,
-        output_dir=model_dir
-    )
+    os.replace(upload_path, path)
+
+    return path
 
 @app.route("/process-all-sales", methods=["POST"])
 def process_all_sales():
@@ -308,60 +161,169 @@ def process_all_sales():
 
     restaurant_id = get_restaurant_id(session["user_id"])
 
-    for menu_item, csv in zip(menu_items, csv_files):
-        csv_path = save_csv(restaurant_id, menu_item, csv)
+    try:
+        uploads = [
+            (menu_item, save_csv(restaurant_id, menu_item, csv))
+            for menu_item, csv in zip(menu_items, csv_files)
+        ]
+    except SalesFileError as e:
+        return str(e), 400
 
-        train_menu_item_model(
-            restaurant_id=restaurant_id,
-            menu_item=menu_item,
-            csv_path=csv_path
-        )
+    # Training runs in the background; the dashboard polls /training-status
+    from ml.jobs import enqueue_training
+
+    batch_id = enqueue_training(restaurant_id, uploads)
+
+    return redirect(f"/dashboard?batch={batch_id}")
+
+@app.route("/model-settings", methods=["POST"])
+def model_settings():
+    if "user_id" not in session:
+        return redirect("/login")
+
+    restaurant_id = get_restaurant_id(session["user_id"])
+
+    from ml.backends import set_backend, set_layout
+
+    try:
+        # No backend picked: only the layout changes
+        if request.form.get("backend"):
+            set_backend(
+                restaurant_id,
+                request.form["backend"],
+                request.form.get("menu_item", "").strip()
+            )
+        if request.form.get("layout"):
+            set_layout(restaurant_id, request.form["layout"])
+    except ValueError as e:
+        return str(e), 400
 
     return redirect("/dashboard")
 
-def load_dashboard_context(restaurant_id, uid):
+@app.route("/training-status")
+def training_status():
+    if "user_id" not in session:
+        return redirect("/login")
+
+    restaurant_id = get_restaurant_id(session["user_id"])
+
+    from ml.jobs import job_status
+
+    return jsonify(job_status(restaurant_id, request.args.get("batch")))
+
+@app.route("/cache-stats")
+def cache_stats():
+    if "user_id" not in session:
+        return redirect("/login")
+
+    from ml.cache import model_cache, result_cache
+
+    return jsonify(dict(model_cache.stats(), results=result_cache.stats()))
+
+@app.route("/metrics")
+def metrics_route():
+    # For a local Prometheus scrape, not for users
+    if request.remote_addr not in metrics.ALLOWED_SCRAPERS:
+        return "Forbidden", 403
+
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+def load_dashboard_context(restaurant_id):
+    """
+    Everything dashboard.html needs, read once per request on the
+    request's connection and reused by later calls in the same request.
+    """
+    from ml.forecast import upcoming_forecasts
+
+    cached = g.get("dashboard_context")
+    if cached is not None and cached[0] == restaurant_id:
+        return cached[1]
+
     with get_db() as con:
-        cur = con.cursor()
-        cur.execute("""
+        cur = con.execute("""
             SELECT r.name,
                    f.grocery_management,
                    f.staff_management,
-                   f.combo_creation
+                   f.combo_creation,
+                   EXISTS (
+                       SELECT 1 FROM recipe_mapping m
+                       WHERE m.restaurant_id = r.id
+                   )
             FROM restaurants r
             JOIN feature_settings f ON f.restaurant_id = r.id
-            WHERE r.user_id = ?
-        """, (uid,))
+            WHERE r.id = ?
+        """, (restaurant_id,))
         row = cur.fetchone()
 
-    return {
-        "user": {"restaurant_name": row[0]},
-        "services": {
-            "grocery": bool(row[1]),
-            "staff": bool(row[2]),
-            "combo": bool(row[3])
+        context = {
+            "user": {"restaurant_name": row[0]},
+            "services": {
+                "grocery": bool(row[1]),
+                "staff": bool(row[2]),
+                "combo": bool(row[3])
+            },
+            "recipe_exists": bool(row[4]),
+            "menu_items": get_trained_menu_items(restaurant_id),
+            "predictions": load_predictions(restaurant_id),
+            "staff_history": load_staff_history(restaurant_id),
+            "combos": load_combos(restaurant_id),
+            "model_backends": model_backends(restaurant_id),
+            "forecasts": upcoming_forecasts(restaurant_id)
         }
+
+    g.dashboard_context = (restaurant_id, context)
+    return context
+
+def model_backends(restaurant_id):
+    from ml.backends import BACKENDS, LAYOUTS, resolve_backend, resolve_layout
+
+    return {
+        "options": {name: spec["label"] for name, spec in BACKENDS.items()},
+        "current": resolve_backend(restaurant_id, ""),
+        "layouts": LAYOUTS,
+        "layout": resolve_layout(restaurant_id)
     }
 
-def load_predictions(restaurant_id):
+def render_dashboard(restaurant_id, **values):
+    with timed("dashboard_context"):
+        context = dict(load_dashboard_context(restaurant_id), auto_open_manage=False)
+    context.update(values)
+
+    with timed("render"):
+        return render_template("dashboard.html", **context)
+
+def keyset_clause(time_column, before):
+    # Rows strictly older than the last row of the previous page
+    if before is None:
+        return "", ()
+    return f"AND ({time_column}, id) < (?, ?)", tuple(before)
+
+def load_predictions(restaurant_id, before=None, limit=HISTORY_PAGE_SIZE):
+    clause, params = keyset_clause("predicted_at", before)
     with get_db() as con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT menu_item, predicted_at, servings
+        cur.execute(f"""
+            SELECT menu_item, predicted_at, servings, id
             FROM predictions
             WHERE restaurant_id = ?
-            ORDER BY predicted_at DESC
-        """, (restaurant_id,))
+            {clause}
+            ORDER BY predicted_at DESC, id DESC
+            LIMIT ?
+        """, (restaurant_id, *params, limit))
         return cur.fetchall()
     
-def load_staff_history(restaurant_id):
+def load_staff_history(restaurant_id, before=None, limit=HISTORY_PAGE_SIZE):
+    clause, params = keyset_clause("calculated_at", before)
     with get_db() as con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT menu_item, predicted_servings, cooks, helpers, cleaners, calculated_at
+        cur.execute(f"""
+            SELECT menu_item, predicted_servings, cooks, helpers, cleaners, calculated_at, id
             FROM staff_predictions
             WHERE restaurant_id = ?
-            ORDER BY calculated_at DESC
-        """, (restaurant_id,))
+            {clause}
+            ORDER BY calculated_at DESC, id DESC
+            LIMIT ?
+        """, (restaurant_id, *params, limit))
         return cur.fetchall()    
 
 @app.route("/predict", methods=["POST"])
@@ -379,48 +341,152 @@ def predict():
         "meal_period": request.form["meal_period"],
         "is_holiday": int(request.form.get("holiday", 0)),
         "weather": request.form["weather"],
-        "temperature": float(request.form.get("temperature", 25)),
-        "sales_last_30d_avg": get_last_30d_avg(
+        "temperature": float(request.form.get("temperature", 25))
+    }
+
+    from ml.forecast import cached_prediction
+
+    # Precomputed forecasts cover the default assumptions; anything
+    # else is predicted live
+    with timed("forecast_lookup"):
+        prediction = cached_prediction(
             restaurant_id,
-            menu_item
+            menu_item,
+            date_obj.strftime("%Y-%m-%d"),
+            features["meal_period"],
+            features["weather"],
+            features["temperature"],
+            features["is_holiday"]
         )
-    }
 
-    from ml.predict import predict_demand
+    if prediction is None:
+        from ml.predict import predict_demand
 
-    prediction = predict_demand(
-        restaurant_id=restaurant_id,
-        menu_item=menu_item,
-        features=features
-    )
+        with timed("last_30d_avg"):
+            features["sales_last_30d_avg"] = get_last_30d_avg(restaurant_id, menu_item)
 
-    context = load_dashboard_context(restaurant_id, session["user_id"])
+        prediction = predict_demand(
+            restaurant_id=restaurant_id,
+            menu_item=menu_item,
+            features=features
+        )
 
     if "error" in prediction:
-        recipe_exists = has_recipe_setup(restaurant_id)
-        return render_template(
-            "dashboard.html",
-            error=prediction["error"],
-            menu_items=get_trained_menu_items(restaurant_id),
-            predictions=[],
-            recipe_exists=recipe_exists,
-            auto_open_manage=False,
-            **context
-        )
+        return render_dashboard(restaurant_id, error=prediction["error"])
+
+    return render_dashboard(restaurant_id, prediction=prediction)
+
+def expand_prediction_grid(payload):
+    """
+    Turn a /predict-batch body into a list of feature rows.
+
+    Either pass explicit rows:
+        {"rows": [{"menu_item", "date", "meal_period", "weather",
+                   "temperature", "holiday"}, ...]}
+    or a grid that is expanded to every combination:
+        {"menu_items": [...], "dates": [...], "meal_periods": [...],
+         "weather": "Sunny" | [...], "temperature": 25 | [...],
+         "holiday": 0 | [...]}
+    """
+    from itertools import product
+
+    if "rows" in payload:
+        rows = payload["rows"]
+    else:
+        def as_list(value):
+            return value if isinstance(value, list) else [value]
+
+        rows = [
+            {
+                "menu_item": m,
+                "date": d,
+                "meal_period": mp,
+                "weather": w,
+                "temperature": t,
+                "holiday": h
+            }
+            for m, d, mp, w, t, h in product(
+                payload.get("menu_items", []),
+                payload.get("dates", []),
+                payload.get("meal_periods", ["Lunch", "Dinner"]),
+                as_list(payload.get("weather", "Sunny")),
+                as_list(payload.get("temperature", 25)),
+                as_list(payload.get("holiday", 0))
+            )
+        ]
 
-    predictions = load_predictions(restaurant_id)
-    recipe_exists = has_recipe_setup(restaurant_id)
-
-    return render_template(
-        "dashboard.html",
-        prediction=prediction,
-        staff_history=load_staff_history(restaurant_id),
-        menu_items=get_trained_menu_items(restaurant_id),
-        predictions=predictions,
-        recipe_exists=recipe_exists,
-        auto_open_manage=False,
-        **context
-    )
+    return [
+        {
+            "menu_item": row["menu_item"],
+            "date": row["date"],
+            "day_of_week": datetime.strptime(row["date"], "%Y-%m-%d").strftime("%A"),
+            "meal_period": row["meal_period"],
+            "is_holiday": int(row.get("holiday", 0)),
+            "weather": row["weather"],
+            "temperature": float(row.get("temperature", 25))
+        }
+        for row in rows
+    ]
+
+@app.route("/predict-batch", methods=["POST"])
+def predict_batch_route():
+    if "user_id" not in session:
+        return redirect("/login")
+
+    restaurant_id = get_restaurant_id(session["user_id"])
+    result = predict_rows(restaurant_id, request.get_json(silent=True) or {})
+
+    if "error" in result:
+        return jsonify(result), 400
+
+    return jsonify(result)
+
+# Below this many rows, predicting row by row beats building a batch
+# DataFrame (which costs ~10ms however few rows it has)
+SMALL_BATCH_ROWS = 32
+
+def predict_rows(restaurant_id, payload):
+    """
+    Predictions for a /predict-batch style body:
+    {"predictions": [row + demand + error, ...]} in input order, or
+    {"error": message}.
+    """
+    try:
+        rows = expand_prediction_grid(payload)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {"error": "Invalid input values for prediction."}
+
+    if not rows:
+        return {"error": "Nothing to predict."}
+
+    # One history lookup per menu item, not per row
+    averages = {}
+    for row in rows:
+        item = row["menu_item"]
+        if item not in averages:
+            averages[item] = get_last_30d_avg(restaurant_id, item)
+        row["sales_last_30d_avg"] = averages[item]
+
+    if len(rows) < SMALL_BATCH_ROWS:
+        from ml.predict import predict_demand
+
+        predictions = []
+        for row in rows:
+            prediction = predict_demand(restaurant_id, row["menu_item"], row)
+            predictions.append(dict(
+                row,
+                demand=prediction.get("demand"),
+                error=prediction.get("error")
+            ))
+
+        return {"predictions": predictions}
+
+    from ml.predict import predict_batch
+
+    table = predict_batch(restaurant_id, rows)
+    table = table.astype(object).where(table.notna(), None)
+
+    return {"predictions": table.to_dict(orient="records")}
 
 @app.route("/save-prediction", methods=["POST"])
 def save_prediction():
@@ -459,32 +525,17 @@ def grocery_setup():
     quantities = request.form.getlist("qty_per_serving[]")
     units = request.form.getlist("unit[]")
 
-    with get_db() as con:
-        cur = con.cursor()
+    from mappings import save_recipe
 
-        cur.execute("""
-            DELETE FROM recipe_mapping
-            WHERE restaurant_id = ?
-            AND menu_item = ?
-        """, (restaurant_id, menu_item))
-
-        for name, qty, unit in zip(ingredients, quantities, units):
-            if name.strip() == "":
-                continue
-
-            cur.execute("""
-                INSERT INTO recipe_mapping
-                (restaurant_id, menu_item, ingredient_name, qty_per_serving, unit)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                restaurant_id,
-                menu_item,
-                name.strip(),
-                float(qty),
-                unit.strip()
-            ))
+    # A repeated ingredient keeps its last row
+    recipe = [
+        (name.strip(), float(qty), unit.strip())
+        for name, qty, unit in zip(ingredients, quantities, units)
+        if name.strip() != ""
+    ]
 
-        con.commit()
+    with get_db() as con:
+        save_recipe(con, restaurant_id, menu_item, recipe)
 
     return redirect("/dashboard")
 
@@ -498,58 +549,58 @@ def calculate_groceries():
     menu_item = request.form["menu_item"]
     servings = float(request.form["servings"])
 
-    with get_db() as con:
-        cur = con.cursor()
-        cur.execute("""
-            SELECT ingredient_name, qty_per_serving, unit
-            FROM recipe_mapping
-            WHERE restaurant_id = ?
-            AND menu_item = ?
-        """, (restaurant_id, menu_item))
+    results = grocery_requirements(restaurant_id, [(menu_item, servings)])[0]
 
-        rows = cur.fetchall()
-
-    if not rows:
-        context = load_dashboard_context(restaurant_id, session["user_id"])
-        recipe_exists = has_recipe_setup(restaurant_id)
-
-        return render_template(
-            "dashboard.html",
+    if results is None:
+        return render_dashboard(
+            restaurant_id,
             error="No recipe defined for this menu item.",
-            menu_items=get_trained_menu_items(restaurant_id),
-            staff_history=load_staff_history(restaurant_id),
-            predictions=load_predictions(restaurant_id),
-            recipe_exists=recipe_exists,
-            auto_open_manage=True,
-            **context
+            auto_open_manage=True
         )
 
+    return render_dashboard(
+        restaurant_id,
+        grocery_results=results,
+        selected_menu=menu_item,
+        entered_servings=servings,
+        auto_open_manage=True
+    )
+
+def grocery_requirements(restaurant_id, items):
+    """
+    items : list of (menu_item, servings)
 
-    results = []
-    for ingredient, qty_per_serving, unit in rows:
-        required = round(qty_per_serving * servings, 2)
-        results.append({
-            "ingredient": ingredient,
-            "required": required,
-            "unit": unit
-        })
+    Ingredients each item needs for its servings, read with one recipe
+    query for all of them. Returns a list in item order holding
+    [{"ingredient", "required", "unit"}, ...], or None for an item
+    without a recipe.
+    """
+    names = sorted({menu_item for menu_item, _ in items})
 
-    context = load_dashboard_context(restaurant_id, session["user_id"])
-    recipe_exists = has_recipe_setup(restaurant_id)
-
-
-    return render_template(
-    "dashboard.html",
-    grocery_results=results,
-    selected_menu=menu_item,
-    entered_servings=servings,
-    menu_items=get_trained_menu_items(restaurant_id),
-    staff_history=load_staff_history(restaurant_id),
-    predictions=load_predictions(restaurant_id),
-    recipe_exists=recipe_exists,
-    auto_open_manage=True,
-    **context
-    )
+    with get_db() as con:
+        cur = con.execute(f"""
+            SELECT menu_item, ingredient_name, qty_per_serving, unit
+            FROM recipe_mapping
+            WHERE restaurant_id = ?
+            AND menu_item IN ({", ".join("?" * len(names))})
+            ORDER BY id
+        """, (restaurant_id, *names))
+
+        recipes = {}
+        for menu_item, ingredient, qty_per_serving, unit in cur.fetchall():
+            recipes.setdefault(menu_item, []).append((ingredient, qty_per_serving, unit))
+
+    return [
+        [
+            {
+                "ingredient": ingredient,
+                "required": round(qty_per_serving * servings, 2),
+                "unit": unit
+            }
+            for ingredient, qty_per_serving, unit in recipes[menu_item]
+        ] if menu_item in recipes else None
+        for menu_item, servings in items
+    ]
 
 @app.route("/save-staff-config", methods=["POST"])
 def save_staff_config():
@@ -564,30 +615,15 @@ def save_staff_config():
     helpers = request.form.getlist("helpers[]")
     cleaners = request.form.getlist("cleaners[]")
 
-    with get_db() as con:
-        cur = con.cursor()
-
-        for m, b, c, h, cl in zip(menu_items, base_servings, cooks, helpers, cleaners):
+    from mappings import upsert_staff
 
-            cur.execute("""
-                DELETE FROM staff_mapping
-                WHERE restaurant_id = ?
-                AND menu_item = ?
-            """, (restaurant_id, m))
-
-            cur.execute("""
-                INSERT INTO staff_mapping
-                (restaurant_id, menu_item, base_servings, cooks, helpers, cleaners)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                restaurant_id,
-                m,
-                int(b),
-                int(c),
-                int(h),
-                int(cl)
-            ))
+    rows = [
+        (m, int(b), int(c), int(h), int(cl))
+        for m, b, c, h, cl in zip(menu_items, base_servings, cooks, helpers, cleaners)
+    ]
 
+    with get_db() as con:
+        upsert_staff(con, restaurant_id, rows)
         con.commit()
 
     return redirect("/dashboard")
@@ -601,76 +637,21 @@ def calculate_staff_route():
     menu_item = request.form["menu_item"]
     predicted_servings = int(request.form["predicted_servings"])
 
-    with get_db() as con:
-        cur = con.cursor()
-        cur.execute("""
-            SELECT base_servings, cooks, helpers, cleaners
-            FROM staff_mapping
-            WHERE restaurant_id = ?
-            AND menu_item = ?
-        """, (restaurant_id, menu_item))
+    from planning import record_staff_plan, staff_plan
 
-        row = cur.fetchone()
+    staff_results = staff_plan(restaurant_id, [(menu_item, predicted_servings)])["items"][0]
 
-    if not row:
-        context = load_dashboard_context(restaurant_id, session["user_id"])
-        return render_template(
-            "dashboard.html",
-            error="No staff configuration found for this menu item.",
-            menu_items=get_trained_menu_items(restaurant_id),
-            predictions=load_predictions(restaurant_id),
-            staff_history=load_staff_history(restaurant_id),
-            recipe_exists=has_recipe_setup(restaurant_id),
-            auto_open_manage=False,
-            **context
-        )
-
-    base_servings, cooks, helpers, cleaners = row
-
-    result = calculate_staff(
-        base_servings,
-        predicted_servings,
-        cooks,
-        helpers,
-        cleaners
-    )
-
-    staff_results = {
-        "menu_item": menu_item,
-        "servings": predicted_servings,
-        "cooks": result["cooks"],
-        "helpers": result["helpers"],
-        "cleaners": result["cleaners"]
-    }
-
-    context = load_dashboard_context(restaurant_id, session["user_id"])
-    with get_db() as con:
-        con.execute("""
-            INSERT INTO staff_predictions
-            (restaurant_id, menu_item, predicted_servings, cooks, helpers, cleaners)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
+    if staff_results is None:
+        return render_dashboard(
             restaurant_id,
-            menu_item,
-            predicted_servings,
-            result["cooks"],
-            result["helpers"],
-            result["cleaners"]
-        ))
-        con.commit()
+            error="No staff configuration found for this menu item."
+        )
 
+    record_staff_plan(restaurant_id, [staff_results])
 
-    return render_template(
-        "dashboard.html",
-        staff_results=staff_results,
-        staff_history=load_staff_history(restaurant_id), 
-        menu_items=get_trained_menu_items(restaurant_id),
-        predictions=load_predictions(restaurant_id),
-        recipe_exists=has_recipe_setup(restaurant_id),
-        auto_open_manage=False,
-        **context
-    )
+    return render_dashboard(restaurant_id, staff_results=staff_results)
     # return redirect("/dashboard")
+
 @app.route("/prepare-combo", methods=["POST"])
 def prepare_combo():
 
@@ -683,13 +664,39 @@ def prepare_combo():
     predicted = request.form.getlist("predicted_servings[]")
     sold = request.form.getlist("sold_quantity[]")
     costs = request.form.getlist("cost_per_item[]")
+    max_price = request.form.get("max_price")
 
-    
+    from combos import DISCOUNTS, MIN_ITEMS, suggest_combos
+
+    combo_data, _ = combo_candidates(zip(menu_items, predicted, sold, costs))
+
+    if len(combo_data) < MIN_ITEMS:
+        return redirect("/dashboard")
+
+    suggestions = suggest_combos(combo_data, max_price=float(max_price) if max_price else None)
+
+    if not suggestions:
+        return render_dashboard(restaurant_id, error="No combo fits that price.")
+
+    return render_dashboard(
+        restaurant_id,
+        show_discount_options=True,
+        combo_suggestions=suggestions,
+        discounts=DISCOUNTS
+    )
+
+
+
+def combo_candidates(items):
+    """
+    items : iterable of (menu_item, predicted, sold, cost_per_item)
 
+    The items with servings left over, and their summed cost.
+    """
     combo_data = []
     total_cost = 0
 
-    for m, p, s, c in zip(menu_items, predicted, sold, costs):
+    for m, p, s, c in items:
 
         leftover = int(p) - int(s)
 
@@ -706,24 +713,7 @@ def prepare_combo():
 
         total_cost += item_cost
 
-    context = load_dashboard_context(restaurant_id, session["user_id"])
-    if len(combo_data) < 3:
-        return redirect("/dashboard")
-
-    return render_template(
-        "dashboard.html",
-        show_discount_options=True,
-        combo_data=combo_data,
-        total_cost=total_cost,
-        menu_items=get_trained_menu_items(restaurant_id),
-        predictions=load_predictions(restaurant_id),
-        staff_history=load_staff_history(restaurant_id),
-        combos=load_combos(restaurant_id),   # ADD THIS
-        recipe_exists=has_recipe_setup(restaurant_id),
-        **context
-    )
-
-
+    return combo_data, total_cost
 
 @app.route("/create-combo", methods=["POST"])
 def create_combo():
@@ -735,15 +725,14 @@ def create_combo():
 
     import json
 
+    from combos import combo_price
+
     combo_data = json.loads(request.form["combo_data"])
     discount = float(request.form["discount"])
 
     total_cost = sum(item["cost_per_item"] for item in combo_data)
 
-    final_price = round(
-        total_cost * (1 + discount / 100),
-        2
-    )
+    final_price = combo_price(total_cost, discount)
     
     combo_name = " + ".join([item["menu_item"] for item in combo_data])
     combo_name = combo_name + "(Super Saver)"
@@ -767,18 +756,341 @@ def create_combo():
     return redirect("/dashboard")
 
 
-def load_combos(restaurant_id):
+def load_combos(restaurant_id, before=None, limit=HISTORY_PAGE_SIZE):
+    clause, params = keyset_clause("created_at", before)
     with get_db() as con:
         cur = con.cursor()
-        cur.execute("""
-            SELECT combo_name, final_price, discount_percent, created_at
+        cur.execute(f"""
+            SELECT combo_name, final_price, discount_percent, created_at, id
             FROM combos
             WHERE restaurant_id = ?
-            ORDER BY created_at DESC
-        """, (restaurant_id,))
+            {clause}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (restaurant_id, *params, limit))
         return cur.fetchall()
 
+HISTORY_LOADERS = {
+    "predictions": (load_predictions, 1),
+    "staff": (load_staff_history, 5),
+    "combos": (load_combos, 3)
+}
 
+@app.route("/history/<kind>")
+def history_page(kind):
+    if "user_id" not in session:
+        return redirect("/login")
+
+    if kind not in HISTORY_LOADERS:
+        return jsonify({"error": "Unknown history"}), 404
+
+    restaurant_id = get_restaurant_id(session["user_id"])
+    loader, time_index = HISTORY_LOADERS[kind]
+
+    before = None
+    if request.args.get("before") and request.args.get("before_id"):
+        try:
+            before = (request.args["before"], int(request.args["before_id"]))
+        except ValueError:
+            return jsonify({"error": "before_id must be an integer"}), 400
+
+    rows = loader(restaurant_id, before=before)
+
+    next_page = None
+    if len(rows) == HISTORY_PAGE_SIZE:
+        next_page = {"before": rows[-1][time_index], "before_id": rows[-1][-1]}
+
+    return jsonify({"rows": rows, "next": next_page})
+
+
+# JSON API for kiosks and POS integrations: the same computations as
+# the dashboard forms, batched, answering with just the numbers
+# instead of re-rendering the dashboard. Authenticated by the same
+# session cookie as the site.
+
+def api_restaurant_id():
+    if "user_id" not in session:
+        return None
+    return get_restaurant_id(session["user_id"])
+
+def api_error(message, status=400):
+    return jsonify({"error": message}), status
+
+def api_items(payload, *fields):
+    """
+    The "items" list of a request body as tuples of `fields`, each
+    converted with its type, e.g. api_items(body, ("servings", float)).
+    Raises ValueError for a malformed body.
+    """
+    items = payload.get("items") if isinstance(payload, dict) else None
+
+    if not isinstance(items, list) or not items:
+        raise ValueError("Body needs a non-empty \"items\" list.")
+
+    try:
+        return [tuple(convert(item[name]) for name, convert in fields) for item in items]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Every item needs {', '.join(name for name, _ in fields)}.")
+
+@app.route("/api/v1/predict", methods=["POST"])
+def api_predict():
+    """
+    Body as for /predict-batch. Returns
+    {"predictions": [{"menu_item", "date", "meal_period", "demand", "error"}]}.
+    """
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    result = predict_rows(restaurant_id, request.get_json(silent=True) or {})
+
+    if "error" in result:
+        return api_error(result["error"])
+
+    columns = ["menu_item", "date", "meal_period", "demand", "error"]
+    return jsonify({"predictions": [
+        {col: row[col] for col in columns}
+        for row in result["predictions"]
+    ]})
+
+@app.route("/api/v1/groceries", methods=["POST"])
+def api_groceries():
+    """
+    {"items": [{"menu_item", "servings"}, ...]} ->
+    {"groceries": [{"menu_item", "servings", "ingredients" | "error"}]}
+    """
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    try:
+        items = api_items(request.get_json(silent=True), ("menu_item", str), ("servings", float))
+    except ValueError as e:
+        return api_error(str(e))
+
+    results = grocery_requirements(restaurant_id, items)
+
+    return jsonify({"groceries": [
+        dict(
+            {"menu_item": menu_item, "servings": servings},
+            **({"ingredients": ingredients} if ingredients is not None
+               else {"error": "No recipe defined for this menu item."})
+        )
+        for (menu_item, servings), ingredients in zip(items, results)
+    ]})
+
+@app.route("/api/v1/grocery-plan", methods=["POST"])
+def api_grocery_plan():
+    """
+    Purchase list for a servings plan, shared ingredients summed and
+    units normalized (see planning.grocery_plan). Body:
+
+        {"items": [{"menu_item", "servings", "date"?}, ...]}
+     or {"forecast": {"start": "YYYY-MM-DD"?, "days": 7}}
+
+    plus "by_date": true to split the totals per day. A forecast range
+    must end within FF_FORECAST_DAYS of today.
+    """
+    from planning import forecast_plan, grocery_plan
+
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    payload = request.get_json(silent=True)
+
+    try:
+        if isinstance(payload, dict) and "forecast" in payload:
+            forecast = payload["forecast"] or {}
+            start = forecast.get("start")
+            plan = forecast_plan(
+                restaurant_id,
+                datetime.strptime(start, "%Y-%m-%d").date() if start else None,
+                int(forecast.get("days", 7))
+            )
+        else:
+            items = api_items(payload, ("menu_item", str), ("servings", float))
+            plan = [
+                (menu_item, item.get("date"), servings)
+                for (menu_item, servings), item in zip(items, payload["items"])
+            ]
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return api_error(str(e) if isinstance(e, ValueError) else "Invalid grocery plan.")
+
+    result = grocery_plan(restaurant_id, plan, by_date=bool(payload.get("by_date")))
+    result["plan_rows"] = len(plan)
+
+    return jsonify(result)
+
+@app.route("/api/v1/staff", methods=["POST"])
+def api_staff():
+    """
+    Staff for a shift (see planning.staff_plan). Body:
+
+        {"items": [{"menu_item", "servings"}, ...]}
+     or {"forecast": {"date": "YYYY-MM-DD"?, "meal_period": "Dinner"}}
+
+    plus "pooled": true to round the shift's totals instead of each
+    item. Returns {"staff": [{"menu_item", "servings", "cooks",
+    "helpers", "cleaners"} | {..., "error"}], "totals", "pooled"}.
+
+    Results are recorded in the staff history in one transaction, as
+    the dashboard form does; pass "save": false to only compute them.
+    """
+    from planning import forecast_plan, record_staff_plan, staff_plan
+
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    payload = request.get_json(silent=True)
+
+    try:
+        if isinstance(payload, dict) and "forecast" in payload:
+            forecast = payload["forecast"] or {}
+            day = forecast.get("date")
+            items = [
+                (menu_item, int(servings))
+                for menu_item, _, servings in forecast_plan(
+                    restaurant_id,
+                    datetime.strptime(day, "%Y-%m-%d").date() if day else None,
+                    1,
+                    forecast["meal_period"]
+                )
+            ]
+        else:
+            items = api_items(payload, ("menu_item", str), ("servings", int))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return api_error(str(e) if isinstance(e, ValueError) else "Invalid staff plan.")
+
+    if not items:
+        return api_error("Nothing to plan: no forecast for this meal period.", 422)
+
+    plan = staff_plan(restaurant_id, items, pooled=bool(payload.get("pooled")))
+
+    if payload.get("save", True):
+        record_staff_plan(restaurant_id, plan["items"])
+
+    return jsonify({
+        "staff": [
+            result if result is not None else {
+                "menu_item": menu_item,
+                "servings": servings,
+                "error": "No staff configuration found for this menu item."
+            }
+            for (menu_item, servings), result in zip(items, plan["items"])
+        ],
+        "totals": plan["totals"],
+        "pooled": plan["pooled"]
+    })
+
+@app.route("/api/v1/mappings/<kind>", methods=["POST"])
+def api_import_mappings(kind):
+    """
+    Bulk-import recipe or staff mappings from a CSV (see mappings.py),
+    uploaded as the "file" field of a form or sent as a text/csv body.
+    ?replace=1 makes each recipe in the file the item's whole recipe.
+    Returns {"rows", "menu_items"}.
+    """
+    from mappings import MappingFileError, import_mappings, text_stream
+
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    if kind not in ("recipes", "staff"):
+        return api_error("Unknown mapping kind.", 404)
+
+    if "file" in request.files:
+        stream = text_stream(request.files["file"])
+    else:
+        stream = text_stream(request)
+
+    try:
+        with get_db() as con:
+            result = import_mappings(
+                con, restaurant_id, kind, stream,
+                replace=request.args.get("replace") == "1"
+            )
+    except (MappingFileError, UnicodeDecodeError) as e:
+        return api_error(str(e))
+
+    return jsonify(result)
+
+@app.route("/api/v1/combo-candidates", methods=["POST"])
+def api_combo_candidates():
+    """
+    {"items": [{"menu_item", "predicted_servings", "sold_quantity",
+                "cost_per_item"}, ...]} ->
+    {"combos": [...]}, the leftover-clearing combos /prepare-combo
+    suggests (see combos.suggest_combos). Optional: "limit",
+    "discount", "max_price", "min_items", "max_items".
+    """
+    from combos import MAX_ITEMS, MIN_ITEMS, suggest_combos
+
+    restaurant_id = api_restaurant_id()
+    if restaurant_id is None:
+        return api_error("Not logged in.", 401)
+
+    payload = request.get_json(silent=True)
+
+    try:
+        items = api_items(
+            payload,
+            ("menu_item", str), ("predicted_servings", int),
+            ("sold_quantity", int), ("cost_per_item", float)
+        )
+        options = {
+            "limit": int(payload.get("limit", 5)),
+            "discount": float(payload.get("discount", -10)),
+            "max_price": float(payload["max_price"]) if payload.get("max_price") is not None else None,
+            "min_items": int(payload.get("min_items", MIN_ITEMS)),
+            "max_items": int(payload.get("max_items", MAX_ITEMS))
+        }
+    except (TypeError, ValueError) as e:
+        return api_error(str(e))
+
+    if not 1 <= options["min_items"] <= options["max_items"]:
+        return api_error("Need 1 <= min_items <= max_items.")
+
+    combo_data, _ = combo_candidates(items)
+
+    if len(combo_data) < options["min_items"]:
+        return api_error("Not enough items with leftovers for a combo.", 422)
+
+    return jsonify({"combos": suggest_combos(combo_data, **options)})
+
+
+# FF_WARMUP_MODELS=N preloads the N most used models (and compiles the
+# templates) at import, i.e. in the master process under
+# `gunicorn --preload`, before workers fork
+if os.environ.get("FF_WARMUP_MODELS"):
+    from ml.predict import warm_up
+
+    warm_up(int(os.environ["FF_WARMUP_MODELS"]))
+    for template in ("dashboard.html", "login.html", "signup.html"):
+        app.jinja_env.get_template(template)
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations."""
+    from migrations import migrate
+
+    applied = migrate()
+    print(f"Applied migration(s) {applied}" if applied else "Schema is up to date")
+
+    # Run before the server starts: nothing can still be training, so
+    # every unfinished job was cut off by the last shutdown
+    from ml.jobs import fail_stale_jobs
+
+    interrupted = fail_stale_jobs(max_age=0)
+    if interrupted:
+        print(f"Marked {interrupted} interrupted training job(s) failed")
 
 if __name__ == '__main__':
+    from migrations import migrate
+    from ml.jobs import fail_stale_jobs
+
+    migrate()
+    fail_stale_jobs(max_age=0)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+HTML form routes vs the /api/v1 JSON routes: latency and response
+size for the same computation.
+
+    python benchmarks/bench_api.py [requests]
+
+The dashboard routes re-render the whole page (history tables
+included, here with a realistic amount of history); the API answers
+with just the numbers.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_startup import setup  # noqa: E402
+
+CASES = [
+    ("predict",
+     "/predict", {"data": {"menu_item": "bench", "date": "2024-03-01", "meal_period": "Dinner",
+                           "weather": "Rainy", "temperature": "31"}},
+     "/api/v1/predict", {"json": {"rows": [{"menu_item": "bench", "date": "2024-03-01",
+                                            "meal_period": "Dinner", "weather": "Rainy",
+                                            "temperature": 31}]}}),
+    ("groceries",
+     "/calculate-groceries", {"data": {"menu_item": "bench", "servings": "40"}},
+     "/api/v1/groceries", {"json": {"items": [{"menu_item": "bench", "servings": 40}]}}),
+    ("staff",
+     "/calculate-staff", {"data": {"menu_item": "bench", "predicted_servings": "120"}},
+     "/api/v1/staff", {"json": {"items": [{"menu_item": "bench", "servings": 120}]}})
+]
+
+
+def measure(requests):
+    # Runs in a child interpreter
+    import time
+
+    import app
+    from db import get_db
+
+    con = get_db()
+    con.executemany("""
+        INSERT INTO recipe_mapping
+        (restaurant_id, menu_item, ingredient_name, qty_per_serving, unit)
+        VALUES (1, 'bench', ?, 0.1, 'kg')
+    """, [(f"ingredient {i}",) for i in range(8)])
+    con.execute("""
+        INSERT INTO staff_mapping
+        (restaurant_id, menu_item, base_servings, cooks, helpers, cleaners)
+        VALUES (1, 'bench', 50, 2, 3, 1)
+    """)
+    con.executemany("""
+        INSERT INTO predictions (prediction_uid, restaurant_id, menu_item, servings)
+        VALUES (?, 1, 'bench', 40)
+    """, [(f"p{i}",) for i in range(500)])
+    con.commit()
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+
+    results = {}
+    for name, html_url, html_kwargs, api_url, api_kwargs in CASES:
+        for kind, url, kwargs in (("html", html_url, html_kwargs), ("api", api_url, api_kwargs)):
+            client.post(url, **kwargs)
+
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = client.post(url, **kwargs)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            results[f"{name} {kind}"] = {
+                "median_ms": timings[len(timings) // 2],
+                "bytes": len(response.data)
+            }
+
+    print(json.dumps(results))
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(int(sys.argv[2]))
+        return
+
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = setup(tmp)
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", str(requests)],
+            cwd=tmp, env=dict(env, PYTHONPATH=ROOT, FF_RESULT_CACHE_SIZE="0"),
+            capture_output=True, text=True, check=True
+        )
+        results = json.loads(out.stdout.strip().splitlines()[-1])
+
+    for name, _, _, _, _ in CASES:
+        html, api = results[f"{name} html"], results[f"{name} api"]
+        print(f"{name:10} html {html['median_ms']:6.2f} ms {html['bytes']:7d} B   "
+              f"api {api['median_ms']:6.2f} ms {api['bytes']:6d} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Cold-load time, resident memory and disk size of the memory-mapped
+artifact format against the old joblib model.pkl.
+
+    python benchmarks/bench_artifact.py [sales.csv]
+
+Without a CSV a synthetic 800-row sales history is used. Every load is
+measured in a fresh interpreter so nothing is already on the heap.
+Batch prediction (BATCH_ROWS random rows) is timed after the first
+predict, as the forecast and /api/v1/predict batches see it.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BATCH_ROWS = [1000, 20000]
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(path):
+    # Runs in a child interpreter
+    import time
+
+    # Import sklearn up front so both formats are timed on deserialization
+    # alone (the artifact path does not need sklearn at all)
+    import sklearn.ensemble  # noqa: F401
+
+    from ml.artifact import load_artifact
+    from ml.features import FEATURES
+
+    X = np.zeros((1, len(FEATURES)))
+    before = rss_kb()
+
+    started = time.perf_counter()
+    bundle = load_artifact(path)
+    load_seconds = time.perf_counter() - started
+    after_load = rss_kb()
+
+    started = time.perf_counter()
+    bundle["model"].predict(X)
+    predict_seconds = time.perf_counter() - started
+    after_predict = rss_kb()
+
+    rng = np.random.RandomState(0)
+    batch_ms = {}
+    for rows in BATCH_ROWS:
+        batch = rng.randint(0, 3, size=(rows, len(FEATURES))).astype(float)
+        started = time.perf_counter()
+        bundle["model"].predict(batch)
+        batch_ms[rows] = round((time.perf_counter() - started) * 1000, 2)
+
+    print(json.dumps({
+        "load_ms": round(load_seconds * 1000, 2),
+        "first_predict_ms": round(predict_seconds * 1000, 2),
+        "rss_after_load_kb": after_load - before,
+        "rss_after_predict_kb": after_predict - before,
+        "batch_ms": batch_ms,
+        "rss_after_batch_kb": rss_kb() - before
+    }))
+
+
+def synthetic_csv(path, days=400, seed=0):
+    rng = np.random.RandomState(seed)
+    rows = ["Date,day_of_week,meal_period,is_holiday,weather,temperature,"
+            "sales_last_30d_avg,no_of_servings"]
+    dates = np.datetime64("2023-01-01") + np.arange(days)
+    for d in dates:
+        day = d.astype(object)
+        for meal in ("Lunch", "Dinner"):
+            rows.append(",".join([
+                day.strftime("%d-%m-%Y"),
+                day.strftime("%A"),
+                meal,
+                str(int(rng.rand() < 0.05)),
+                rng.choice(["Sunny", "Rainy", "Cloudy"]),
+                f"{rng.uniform(15, 38):.1f}",
+                f"{rng.uniform(40, 60):.1f}",
+                str(int(rng.normal(50 + seed * 5, 8)))
+            ]))
+    with open(path, "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv", nargs="?")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    from ml.artifact import artifact_size
+    from ml.train import train_and_save
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = args.csv or os.path.join(tmp, "sales.csv")
+        if not args.csv:
+            synthetic_csv(csv_path)
+
+        model_dir = os.path.join(tmp, "model")
+        manifest_path = train_and_save("bench", csv_path, model_dir)
+
+        # The pre-artifact layout: the same forest, pickled whole
+        pickle_path = os.path.join(tmp, "model.pkl")
+        _retrain_pickle(csv_path, pickle_path)
+
+        for label, path in (("model.pkl", pickle_path), ("mmap artifact", manifest_path)):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", path],
+                cwd=ROOT, capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            size = artifact_size(path)
+            print(f"{label:14} disk {size / 1024:9.0f} KB  "
+                  f"load {result['load_ms']:8.2f} ms  "
+                  f"first predict {result['first_predict_ms']:7.2f} ms  "
+                  f"RSS +{result['rss_after_load_kb']} KB after load, "
+                  f"+{result['rss_after_predict_kb']} KB after predict")
+            print(f"{'':14} batch " + "  ".join(
+                f"{rows} rows {ms:8.2f} ms" for rows, ms in result["batch_ms"].items()
+            ) + f"  RSS +{result['rss_after_batch_kb']} KB after batches")
+
+
+def _retrain_pickle(csv_path, pickle_path):
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder
+
+    from ml.features import CATEGORICAL, FEATURES
+
+    df = pd.read_csv(csv_path)
+    encoders = {}
+    for col in CATEGORICAL:
+        encoders[col] = LabelEncoder()
+        df[col] = encoders[col].fit_transform(df[col])
+
+    model = RandomForestRegressor(n_estimators=200, random_state=42)
+    model.fit(df[FEATURES], df["no_of_servings"])
+
+    joblib.dump({"model": model, "encoders": encoders}, pickle_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Fit time, predict latency, artifact size and holdout error for every
+estimator backend on the same sales CSVs.
+
+    python benchmarks/bench_backends.py uploads/user_1/*.csv
+
+The last 20% of each CSV (in file order, i.e. the most recent sales) is
+held out. Predictions are timed through the saved artifact, the same
+way the app serves them.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ml.artifact import artifact_size, load_artifact, save_artifact  # noqa: E402
+from ml.backends import BACKENDS, make_estimator  # noqa: E402
+from ml.features import FEATURES  # noqa: E402
+from ml.train import load_training_data  # noqa: E402
+
+
+def bench(backend, X_train, y_train, X_test, y_test, encoders, tmp):
+    model = make_estimator(backend)
+
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    path = save_artifact(os.path.join(tmp, backend), model, encoders, FEATURES)
+    served = load_artifact(path)["model"]
+
+    single = []
+    for row in X_test[:200]:
+        started = time.perf_counter()
+        served.predict(row[None, :])
+        single.append(time.perf_counter() - started)
+
+    batch = np.resize(X_test, (1000, X_test.shape[1]))
+    started = time.perf_counter()
+    served.predict(batch)
+    batch_seconds = time.perf_counter() - started
+
+    mae = float(np.mean(np.abs(served.predict(X_test) - y_test)))
+
+    return {
+        "fit_ms": fit_seconds * 1000,
+        "single_ms": statistics.median(single) * 1000,
+        "batch_ms": batch_seconds * 1000,
+        "size_kb": artifact_size(path) / 1024,
+        "mae": mae
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csvs", nargs="+")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    backends = args.backends.split(",")
+
+    print(f"{'csv':24} {'backend':12} {'fit ms':>9} {'1-row ms':>9} "
+          f"{'1000-row ms':>12} {'size KB':>9} {'MAE':>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for csv_path in args.csvs:
+            X, y, encoders = load_training_data(csv_path)
+            X = X.to_numpy(dtype=float)
+            y = y.to_numpy(dtype=float)
+
+            split = int(len(X) * 0.8)
+
+            for backend in backends:
+                result = bench(
+                    backend,
+                    X[:split], y[:split], X[split:], y[split:],
+                    encoders, tmp
+                )
+                print(f"{os.path.basename(csv_path)[:24]:24} {backend:12} "
+                      f"{result['fit_ms']:9.1f} {result['single_ms']:9.3f} "
+                      f"{result['batch_ms']:12.2f} {result['size_kb']:9.0f} "
+                      f"{result['mae']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Combo optimizer solve time and quality against menu size.
+
+    python benchmarks/bench_combos.py [--limit 5] [--max-price 600]
+
+For each menu size, random leftovers and costs are solved with
+combos.suggest_combos. The total clearance value is compared with the
+greedy pass alone, and with the old behaviour of putting every leftover
+item into one combo. Small menus (BRUTE_FORCE_SIZES items) are also
+checked against the optimum found by trying every assignment.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import combos  # noqa: E402
+
+SIZES = [10, 50, 100, 250, 500, 1000, 2000]
+BRUTE_FORCE_SIZES = [6, 7, 8]
+
+
+def menu(n, rng):
+    return [
+        {"menu_item": f"item {i}", "leftover": rng.randint(1, 60), "cost_per_item": rng.randint(20, 300)}
+        for i in range(n)
+    ]
+
+
+def greedy_only(items, limit, max_price):
+    passes = combos.MAX_PASSES
+    combos.MAX_PASSES = 0
+    try:
+        return combos.suggest_combos(items, limit=limit, max_price=max_price)
+    finally:
+        combos.MAX_PASSES = passes
+
+
+def optimum(items, limit, max_price, discount=-10):
+    # Every item goes to no combo or one of `limit`; keep the best valid split
+    cap = float("inf") if max_price is None else max_price / (1 + discount / 100)
+    best = 0
+
+    for labels in itertools.product(range(limit + 1), repeat=len(items)):
+        value = 0
+        for combo in range(1, limit + 1):
+            group = [item for item, label in zip(items, labels) if label == combo]
+            if not group:
+                continue
+
+            total = sum(item["cost_per_item"] for item in group)
+            if not combos.MIN_ITEMS <= len(group) <= combos.MAX_ITEMS or total > cap:
+                break
+            value += min(item["leftover"] for item in group) * total
+        else:
+            best = max(best, value)
+
+    return best
+
+
+def check_optimality(trials, rng):
+    print(f"{'items':>6} {'trials':>7} {'optimal':>8} {'worst ratio':>12}")
+
+    for n in BRUTE_FORCE_SIZES:
+        limit = n // combos.MIN_ITEMS
+        optimal, worst = 0, 1.0
+
+        for _ in range(trials):
+            items = [
+                {"menu_item": f"item {i}", "leftover": rng.randint(1, 15), "cost_per_item": rng.randint(10, 60)}
+                for i in range(n)
+            ]
+            max_price = rng.choice([None, 120, 180])
+
+            best = optimum(items, limit, max_price)
+            found = sum(
+                c["clearance_value"]
+                for c in combos.suggest_combos(items, limit=limit, max_price=max_price)
+            )
+
+            if found >= best - 1e-6:
+                optimal += 1
+            elif best:
+                worst = min(worst, found / best)
+
+        print(f"{n:6d} {trials:7d} {optimal:8d} {worst:12.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--max-price", type=float, default=600)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--trials", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    check_optimality(args.trials, rng)
+    print()
+
+    print(f"{'items':>6} {'solve ms':>9} {'greedy ms':>10} {'value':>10} {'greedy':>10} {'one combo':>10}")
+
+    for n in SIZES:
+        items = menu(n, rng)
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = combos.suggest_combos(items, limit=args.limit, max_price=args.max_price)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        greedy = greedy_only(items, args.limit, args.max_price)
+        greedy_ms = (time.perf_counter() - started) * 1000
+
+        # Old prepare_combo: everything with leftovers, sold until the
+        # scarcest runs out
+        everything = min(i["leftover"] for i in items) * sum(i["cost_per_item"] for i in items)
+
+        print(f"{n:6d} {min(timings):9.1f} {greedy_ms:10.1f} "
+              f"{sum(c['clearance_value'] for c in result):10.0f} "
+              f"{sum(c['clearance_value'] for c in greedy):10.0f} {everything:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
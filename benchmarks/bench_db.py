@@ -0,0 +1,117 @@
+"""
+Requests per second for /calculate-staff with and without the pooled
+WAL connection layer in db.py.
+
+    python benchmarks/bench_db.py --workers 8 --requests 200
+
+Each mode runs in its own process against a fresh database, since the
+pooling switch and the journal mode are both fixed at startup.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(workers, requests_per_worker):
+    # Imported here so FF_DATABASE / FF_DB_POOL from the parent apply
+    sys.path.insert(0, ROOT)
+    import app as feast
+    from migrations import migrate
+
+    migrate()
+
+    client = feast.app.test_client()
+    client.post("/signup", data={
+        "username": "bench",
+        "password": "bench",
+        "restaurant": "Bench Kitchen",
+        "staff": "1"
+    })
+    client.post("/login", data={"username": "bench", "password": "bench"})
+    client.post("/save-staff-config", data={
+        "menu_item[]": ["Biryani"],
+        "base_servings[]": ["50"],
+        "cooks[]": ["2"],
+        "helpers[]": ["3"],
+        "cleaners[]": ["1"]
+    })
+
+    errors = []
+
+    def worker():
+        c = feast.app.test_client()
+        c.post("/login", data={"username": "bench", "password": "bench"})
+        for i in range(requests_per_worker):
+            r = c.post("/calculate-staff", data={
+                "menu_item": "Biryani",
+                "predicted_servings": str(40 + i % 30)
+            })
+            if r.status_code != 200:
+                errors.append(r.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = workers * requests_per_worker
+    print(json.dumps({
+        "requests": total,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1)
+    }))
+
+    # A failing request is not a fast one: don't let it pass as a result
+    if errors:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.workers, args.requests)
+        return
+
+    for label, pooling in (("per-call connect", "0"), ("pooled + WAL", "1")):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                FF_DATABASE=os.path.join(tmp, "bench.db"),
+                FF_DB_POOL=pooling
+            )
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child",
+                 "--workers", str(args.workers), "--requests", str(args.requests)],
+                env=env, cwd=tmp, capture_output=True, text=True
+            )
+            if not out.stdout.strip():
+                sys.exit(f"{label}: benchmark crashed\n{out.stderr}")
+
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{label:18} {result['rps']:>8} req/s  "
+                  f"({result['requests']} requests, {result['errors']} errors, "
+                  f"{result['seconds']}s)")
+
+            if out.returncode:
+                sys.exit(f"{label}: {result['errors']} request(s) failed")
+
+
+if __name__ == "__main__":
+    main()
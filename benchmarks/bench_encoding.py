@@ -0,0 +1,74 @@
+"""
+Encoding cost of the categorical features: sklearn's
+LabelEncoder.transform (the original predict path) against the
+compiled lookup tables, for a single prediction (three columns, one
+value each) and for a batch.
+
+    python benchmarks/bench_encoding.py [--batch 10000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ml.encoding import LookupEncoder  # noqa: E402
+
+COLUMNS = {
+    "day_of_week": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+    "meal_period": ["Breakfast", "Lunch", "Dinner"],
+    "weather": ["Sunny", "Rainy", "Cloudy"]
+}
+
+ROW = {"day_of_week": "Friday", "meal_period": "Dinner", "weather": "Rainy"}
+
+
+def per_call(seconds, number):
+    return seconds / number * 1e6
+
+
+def main():
+    from sklearn.preprocessing import LabelEncoder
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    sklearn_encoders = {col: LabelEncoder().fit(values) for col, values in COLUMNS.items()}
+    lookup_encoders = {col: LookupEncoder(values) for col, values in COLUMNS.items()}
+
+    rng = np.random.RandomState(0)
+    batch = {col: rng.choice(values, args.batch) for col, values in COLUMNS.items()}
+
+    single = {
+        "LabelEncoder.transform": lambda: [
+            sklearn_encoders[col].transform([ROW[col]])[0] for col in COLUMNS
+        ],
+        "lookup table": lambda: [
+            lookup_encoders[col].code(ROW[col]) for col in COLUMNS
+        ]
+    }
+
+    whole = {
+        "LabelEncoder.transform": lambda: [
+            sklearn_encoders[col].transform(batch[col]) for col in COLUMNS
+        ],
+        "lookup table": lambda: [
+            lookup_encoders[col].encode(batch[col]) for col in COLUMNS
+        ]
+    }
+
+    print(f"{'path':24} {'1 row us':>10} {f'{args.batch} rows ms':>14}")
+
+    for name in single:
+        one = min(timeit.repeat(single[name], number=2000, repeat=5))
+        many = min(timeit.repeat(whole[name], number=20, repeat=5))
+        print(f"{name:24} {per_call(one, 2000):10.1f} {per_call(many, 20) / 1000:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+A week's purchase list for a whole menu: planning.grocery_plan (one
+grouped query) against computing it the old way, one recipe query and
+a Python loop per item and day, summed in a dict.
+
+    python benchmarks/bench_grocery_plan.py [--items 300] [--days 7]
+
+Runs against a scratch database with --items recipes of eight
+ingredients drawn from a shared pool of 40.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_item(restaurant_id, plan):
+    from db import get_db
+
+    totals = {}
+
+    for menu_item, _, servings in plan:
+        with get_db() as con:
+            rows = con.execute("""
+                SELECT ingredient_name, qty_per_serving, unit
+                FROM recipe_mapping
+                WHERE restaurant_id = ?
+                AND menu_item = ?
+            """, (restaurant_id, menu_item)).fetchall()
+
+        for ingredient, qty_per_serving, unit in rows:
+            key = (ingredient, unit)
+            totals[key] = totals.get(key, 0) + qty_per_serving * servings
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["FF_DATABASE"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, ROOT)
+
+    from db import get_db
+    from migrations import migrate
+    from planning import grocery_plan
+
+    migrate()
+    rng = random.Random(0)
+    units = ["kg", "g", "l", "ml", "pcs"]
+    pool = [(f"ingredient {i}", units[i % len(units)]) for i in range(40)]
+
+    con = get_db()
+    con.executemany("""
+        INSERT INTO recipe_mapping
+        (restaurant_id, menu_item, ingredient_name, qty_per_serving, unit)
+        VALUES (1, ?, ?, ?, ?)
+    """, [
+        (f"item {i}", name, round(rng.uniform(0.01, 0.5), 3), unit)
+        for i in range(args.items)
+        for name, unit in rng.sample(pool, 8)
+    ])
+    con.commit()
+
+    start = date.today()
+    plan = [
+        (f"item {i}", (start + timedelta(days=d)).isoformat(), rng.randint(10, 200))
+        for i in range(args.items)
+        for d in range(args.days)
+    ]
+
+    for label, run in (("per item x day", lambda: per_item(1, plan)),
+                       ("grocery_plan", lambda: grocery_plan(1, plan)),
+                       ("grocery_plan by_date", lambda: grocery_plan(1, plan, by_date=True))):
+        run()
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:22} {len(plan)} plan rows  {min(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Peak memory and time to ingest a large sales export: the old untyped
+whole-file pd.read_csv against the chunked, typed reader streaming into
+sales_history.
+
+    python benchmarks/bench_ingest.py [--days 20000]
+
+Each variant runs in a fresh interpreter and reports how far its peak
+RSS rose above the interpreter with pandas already imported.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_artifact import synthetic_csv  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE sales_history (
+        restaurant_id INTEGER NOT NULL,
+        menu_item TEXT NOT NULL,
+        date TEXT NOT NULL,
+        meal_period TEXT NOT NULL,
+        day_of_week TEXT NOT NULL,
+        is_holiday INTEGER NOT NULL,
+        weather TEXT NOT NULL,
+        temperature REAL NOT NULL,
+        sales_last_30d_avg REAL NOT NULL,
+        servings REAL NOT NULL,
+        PRIMARY KEY (restaurant_id, menu_item, date, meal_period)
+    ) WITHOUT ROWID;
+"""
+
+
+def peak_rss_kb():
+    # VmHWM, not ru_maxrss: the latter is inherited from the parent that
+    # wrote the CSV
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(variant, csv_path, db_path):
+    # Runs in a child interpreter
+    import pandas as pd
+
+    import sales
+
+    baseline = peak_rss_kb()
+    started = time.perf_counter()
+
+    if variant == "read_csv":
+        df = pd.read_csv(csv_path)
+        rows = len(df)
+    else:
+        con = sqlite3.connect(db_path)
+        con.executescript(SCHEMA)
+        sales.ingest_sales_csv(con, 1, "bench", csv_path)
+        rows = con.execute("SELECT COUNT(*) FROM sales_history").fetchone()[0]
+
+    print(json.dumps({
+        "rows": rows,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_kb": peak_rss_kb() - baseline
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=20000)
+    parser.add_argument("--measure", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "sales.csv")
+        synthetic_csv(csv_path, days=args.days)
+        print(f"{os.path.getsize(csv_path) / 1e6:.1f} MB CSV")
+
+        for variant in ("read_csv", "chunked"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure",
+                 variant, csv_path, os.path.join(tmp, f"{variant}.db")],
+                cwd=ROOT, capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{variant:9} {result['rows']:8} rows  {result['seconds']:6.2f} s  "
+                  f"peak RSS +{result['peak_rss_kb'] / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Per-item models against one global model per restaurant: training
+time, disk size, memory held by the model cache once every item has
+been served, and batch prediction latency.
+
+    python benchmarks/bench_layout.py [--items 20] [--backend rf]
+
+Every item gets its own synthetic 800-row sales history.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_artifact import synthetic_csv  # noqa: E402
+from ml.artifact import artifact_size, load_artifact, save_artifact  # noqa: E402
+from ml.backends import make_estimator  # noqa: E402
+from ml.features import FEATURES, GLOBAL_FEATURES  # noqa: E402
+from ml.train import load_global_training_data, load_training_data  # noqa: E402
+
+
+def fit_and_save(X, y, encoders, features, output_dir, backend):
+    model = make_estimator(backend)
+    model.fit(X.to_numpy(), y.to_numpy())
+    return save_artifact(output_dir, model, encoders, features)
+
+
+def batch_rows(bundle, rows, menu_item=None):
+    # Same shape predict_batch builds: encoded categoricals, numbers as-is
+    X = np.empty((rows, len(bundle["features"])))
+    for i, col in enumerate(bundle["features"]):
+        if col == "menu_item":
+            X[:, i] = bundle["encoders"][col].transform([menu_item])[0]
+        elif col in bundle["encoders"]:
+            X[:, i] = 0
+        else:
+            X[:, i] = 30
+    return X
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--backend", default="rf")
+    parser.add_argument("--rows", type=int, default=7, help="rows predicted per item")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = {}
+        for i in range(args.items):
+            sources[f"item{i:03d}"] = path = os.path.join(tmp, f"item{i:03d}.csv")
+            synthetic_csv(path, seed=i)
+
+        # Per item: one model, one artifact and one cache entry per item
+        started = time.perf_counter()
+        per_item = {}
+        for menu_item, csv_path in sources.items():
+            X, y, encoders = load_training_data(csv_path)
+            per_item[menu_item] = fit_and_save(
+                X, y, encoders, FEATURES,
+                os.path.join(tmp, "per_item", menu_item), args.backend
+            )
+        per_item_fit = time.perf_counter() - started
+
+        bundles = {menu_item: load_artifact(path) for menu_item, path in per_item.items()}
+        started = time.perf_counter()
+        for menu_item, bundle in bundles.items():
+            bundle["model"].predict(batch_rows(bundle, args.rows))
+        per_item_predict = time.perf_counter() - started
+
+        # Global: one model with menu_item as a feature
+        started = time.perf_counter()
+        X, y, encoders = load_global_training_data(sources)
+        global_path = fit_and_save(
+            X, y, encoders, GLOBAL_FEATURES,
+            os.path.join(tmp, "global"), args.backend
+        )
+        global_fit = time.perf_counter() - started
+
+        bundle = load_artifact(global_path)
+        started = time.perf_counter()
+        bundle["model"].predict(np.vstack([
+            batch_rows(bundle, args.rows, menu_item) for menu_item in sources
+        ]))
+        global_predict = time.perf_counter() - started
+
+        per_item_bytes = sum(artifact_size(path) for path in per_item.values())
+        global_bytes = artifact_size(global_path)
+
+        print(f"{args.items} items, backend {args.backend}, {args.rows} rows per item")
+        print(f"{'layout':10} {'fit s':>8} {'disk/cache KB':>14} {'models':>7} {'batch ms':>9}")
+        print(f"{'per_item':10} {per_item_fit:8.2f} {per_item_bytes / 1024:14.0f} "
+              f"{len(per_item):7} {per_item_predict * 1000:9.2f}")
+        print(f"{'global':10} {global_fit:8.2f} {global_bytes / 1024:14.0f} "
+              f"{1:7} {global_predict * 1000:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Bulk recipe import: mappings.import_mappings (streamed CSV, executemany
+upserts, one transaction) against the old grocery_setup pattern of a
+DELETE and one INSERT per ingredient, committed per menu item.
+
+    python benchmarks/bench_mappings.py [--items 2000] [--ingredients 10]
+
+Runs against a scratch database.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_item(recipes):
+    from db import get_db
+
+    for menu_item, ingredients in recipes.items():
+        with get_db() as con:
+            con.execute("""
+                DELETE FROM recipe_mapping
+                WHERE restaurant_id = 1
+                AND menu_item = ?
+            """, (menu_item,))
+
+            for name, qty, unit in ingredients:
+                con.execute("""
+                    INSERT INTO recipe_mapping
+                    (restaurant_id, menu_item, ingredient_name, qty_per_serving, unit)
+                    VALUES (1, ?, ?, ?, ?)
+                """, (menu_item, name, qty, unit))
+
+            con.commit()
+
+
+def bulk(csv_text):
+    from db import get_db
+    from mappings import import_mappings
+
+    with get_db() as con:
+        return import_mappings(con, 1, "recipes", io.StringIO(csv_text), replace=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--ingredients", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["FF_DATABASE"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, ROOT)
+
+    from migrations import migrate
+
+    migrate()
+
+    recipes = {
+        f"item {i}": [(f"ingredient {j}", 0.01 * (j + 1), "kg") for j in range(args.ingredients)]
+        for i in range(args.items)
+    }
+    csv_text = "menu_item,ingredient_name,qty_per_serving,unit\n" + "".join(
+        f"{menu_item},{name},{qty},{unit}\n"
+        for menu_item, ingredients in recipes.items()
+        for name, qty, unit in ingredients
+    )
+    rows = args.items * args.ingredients
+
+    for label, run in (("per item", lambda: per_item(recipes)),
+                       ("import_mappings", lambda: bulk(csv_text)),
+                       ("re-import", lambda: bulk(csv_text))):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        print(f"{label:16} {rows} rows  {elapsed * 1000:8.1f} ms  {rows / elapsed:9.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cost of the request instrumentation: /predict latency (live model
+path, result cache off) with FF_METRICS=0, with metrics on, and with
+Server-Timing headers on as well.
+
+    python benchmarks/bench_metrics.py [requests]
+
+Each setting runs in a fresh interpreter against the same scratch
+database.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_startup import setup  # noqa: E402
+
+
+def measure(requests):
+    # Runs in a child interpreter
+    import time
+
+    import app
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+
+    form = {"menu_item": "bench", "date": "2024-03-01", "meal_period": "Dinner",
+            "weather": "Rainy", "temperature": "31"}
+
+    client.post("/predict", data=form)
+
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.post("/predict", data=form)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(json.dumps({
+        "median_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95)]
+    }))
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(int(sys.argv[2]))
+        return
+
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = setup(tmp)
+
+        for label, extra in (("FF_METRICS=0", {"FF_METRICS": "0"}),
+                             ("metrics on", {}),
+                             ("+ Server-Timing", {"FF_SERVER_TIMING": "1"})):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", str(requests)],
+                cwd=tmp, env=dict(env, PYTHONPATH=ROOT, FF_RESULT_CACHE_SIZE="0", **extra),
+                capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{label:16} /predict median {result['median_ms']:6.2f} ms  "
+                  f"p95 {result['p95_ms']:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Predictions while the model is being retrained: readers call
+predict_demand in a loop while the item is retrained again and again,
+each run publishing a new version and flipping the registry to it.
+
+    python benchmarks/bench_model_swap.py [--retrains 5] [--readers 4]
+
+Reports failed predictions (there should be none), prediction latency
+with and without a retrain running, and the version directories left
+on disk before and after garbage collection.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_artifact import synthetic_csv  # noqa: E402
+
+FEATURES = {
+    "day_of_week": "Friday",
+    "meal_period": "Dinner",
+    "is_holiday": 0,
+    "weather": "Sunny",
+    "temperature": 30.0
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0
+
+
+def read_loop(predict, stop, latencies, errors):
+    n = 0
+    while not stop.is_set():
+        n += 1
+        started = time.perf_counter()
+        try:
+            result = predict(1, "bench", dict(FEATURES, sales_last_30d_avg=40 + n % 20))
+            if "error" in result:
+                errors.append(result["error"])
+        except Exception as e:
+            errors.append(repr(e))
+        latencies.append(time.perf_counter() - started)
+
+
+def run_readers(predict, readers, during):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=read_loop, args=(predict, stop, latencies, errors))
+        for _ in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    during()
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retrains", type=int, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["FF_DATABASE"] = os.path.join(tmp, "bench.db")
+        os.environ["FF_RESULT_CACHE_SIZE"] = "0"
+        os.environ["FF_MODEL_GC_GRACE"] = "0"
+
+        from db import get_db
+        from migrations import migrate
+        from ml.artifact import version_dirs
+        from ml.predict import predict_demand
+        from ml.registry import collect_garbage
+        from ml.train import train_and_save
+
+        migrate()
+        con = get_db()
+        con.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'bench', '-')")
+        con.execute("INSERT INTO restaurants (id, user_id, name) VALUES (1, 1, 'Bench')")
+        con.execute("INSERT INTO feature_settings (restaurant_id) VALUES (1)")
+        con.commit()
+
+        storage = os.path.join(tmp, "storage")
+        model_home = os.path.join(storage, "user_1", "bench")
+
+        csv_paths = []
+        for seed in range(2):
+            csv_paths.append(os.path.join(tmp, f"sales_{seed}.csv"))
+            synthetic_csv(csv_paths[-1], seed=seed)
+
+        train_and_save("bench", csv_paths[0], model_home, restaurant_id=1, incremental=False)
+
+        idle, idle_errors = run_readers(predict_demand, args.readers, lambda: time.sleep(2))
+
+        def retrain():
+            for i in range(args.retrains):
+                train_and_save("bench", csv_paths[(i + 1) % 2], model_home,
+                               restaurant_id=1, incremental=False)
+
+        started = time.perf_counter()
+        busy, busy_errors = run_readers(predict_demand, args.readers, retrain)
+        retrain_seconds = time.perf_counter() - started
+
+        print(f"{args.retrains} retrains in {retrain_seconds:.1f}s under {args.readers} readers")
+        print(f"{'':16} {'predictions':>12} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, latencies, errors in (("idle", idle, idle_errors),
+                                         ("retraining", busy, busy_errors)):
+            print(f"{label:16} {len(latencies):12} {len(errors):7} "
+                  f"{percentile(latencies, 0.5):8.2f} {percentile(latencies, 0.99):8.2f}")
+
+        for error in sorted(set(idle_errors + busy_errors))[:5]:
+            print("  error:", error)
+
+        before = len(version_dirs(model_home))
+        removed = collect_garbage(1, storage=storage)
+        print(f"versions on disk {before}, removed by gc {removed}, "
+              f"left {len(version_dirs(model_home))}")
+
+
+if __name__ == "__main__":
+    main()
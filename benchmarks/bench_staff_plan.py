@@ -0,0 +1,91 @@
+"""
+Planning a shift's staff: planning.staff_plan + record_staff_plan (one
+mapping query, array arithmetic, one executemany transaction) against
+the old per-item way, a mapping query, calculate_staff and an
+insert-and-commit per item.
+
+    python benchmarks/bench_staff_plan.py [--items 200]
+
+Runs against a scratch database.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_item(restaurant_id, items):
+    from db import get_db
+
+    for menu_item, servings in items:
+        with get_db() as con:
+            base, cooks, helpers, cleaners = con.execute("""
+                SELECT base_servings, cooks, helpers, cleaners
+                FROM staff_mapping
+                WHERE restaurant_id = ?
+                AND menu_item = ?
+            """, (restaurant_id, menu_item)).fetchone()
+
+        multiplier = servings / base if base else 0
+        staff = [round(n * multiplier) for n in (cooks, helpers, cleaners)]
+
+        with get_db() as con:
+            con.execute("""
+                INSERT INTO staff_predictions
+                (restaurant_id, menu_item, predicted_servings, cooks, helpers, cleaners)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (restaurant_id, menu_item, servings, *staff))
+            con.commit()
+
+
+def bulk(restaurant_id, items):
+    from planning import record_staff_plan, staff_plan
+
+    record_staff_plan(restaurant_id, staff_plan(restaurant_id, items)["items"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["FF_DATABASE"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, ROOT)
+
+    from db import get_db
+    from migrations import migrate
+
+    migrate()
+    rng = random.Random(0)
+
+    con = get_db()
+    con.executemany("""
+        INSERT INTO staff_mapping
+        (restaurant_id, menu_item, base_servings, cooks, helpers, cleaners)
+        VALUES (1, ?, ?, ?, ?, ?)
+    """, [
+        (f"item {i}", rng.randint(20, 80), rng.randint(1, 3), rng.randint(1, 4), rng.randint(1, 2))
+        for i in range(args.items)
+    ])
+    con.commit()
+
+    items = [(f"item {i}", rng.randint(10, 200)) for i in range(args.items)]
+
+    for label, run in (("per item", per_item), ("staff_plan", bulk)):
+        run(1, items)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run(1, items)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:12} {len(items)} items  {min(timings):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup cost: how long `import app` takes, what running the schema
+migrations costs (this used to happen on every import), and the
+latency of the first requests in a fresh worker, with and without
+FF_WARMUP_MODELS.
+
+    python benchmarks/bench_startup.py
+
+Every measurement runs in a fresh interpreter against a scratch
+database holding one restaurant and one trained model.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_artifact import synthetic_csv  # noqa: E402
+
+
+def measure():
+    # Runs in a child interpreter
+    import time
+
+    started = time.perf_counter()
+    import app
+    import_ms = (time.perf_counter() - started) * 1000
+
+    from migrations import migrate
+
+    started = time.perf_counter()
+    migrate()
+    migrate_ms = (time.perf_counter() - started) * 1000
+
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+
+    started = time.perf_counter()
+    client.get("/login")
+    login_ms = (time.perf_counter() - started) * 1000
+
+    form = {"menu_item": "bench", "date": "2024-03-01", "meal_period": "Dinner",
+            "weather": "Rainy", "temperature": "31"}
+
+    started = time.perf_counter()
+    client.post("/predict", data=form)
+    predict_ms = (time.perf_counter() - started) * 1000
+
+    print(json.dumps({
+        "import_ms": import_ms,
+        "migrate_ms": migrate_ms,
+        "first_login_ms": login_ms,
+        "first_predict_ms": predict_ms,
+        "heavy_modules_after_import": [
+            name for name in ("pandas", "sklearn", "joblib")
+            if name in sys.modules
+        ]
+    }))
+
+
+def setup(tmp):
+    env = dict(os.environ, FF_DATABASE=os.path.join(tmp, "bench.db"))
+    script = f"""
+import sys
+sys.path.insert(0, {ROOT!r})
+from migrations import migrate
+from db import get_db
+from ml.train import train_and_save
+migrate()
+con = get_db()
+con.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'bench', '-')")
+con.execute("INSERT INTO restaurants (id, user_id, name) VALUES (1, 1, 'Bench')")
+con.execute("INSERT INTO feature_settings (restaurant_id) VALUES (1)")
+con.commit()
+train_and_save("bench", {os.path.join(tmp, 'sales.csv')!r}, {os.path.join(tmp, 'model')!r}, restaurant_id=1)
+"""
+    synthetic_csv(os.path.join(tmp, "sales.csv"))
+    subprocess.run([sys.executable, "-c", script], cwd=tmp, env=env, check=True)
+    return env
+
+
+def main():
+    if sys.argv[1:] == ["--measure"]:
+        measure()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = setup(tmp)
+
+        for label, extra in (("cold", {}), ("FF_WARMUP_MODELS=10", {"FF_WARMUP_MODELS": "10"})):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure"],
+                cwd=tmp, env=dict(env, PYTHONPATH=ROOT, **extra),
+                capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{label:20} import app {result['import_ms']:7.1f} ms  "
+                  f"migrate {result['migrate_ms']:6.1f} ms  "
+                  f"first /login {result['first_login_ms']:6.1f} ms  "
+                  f"first /predict {result['first_predict_ms']:7.1f} ms  "
+                  f"loaded: {', '.join(result['heavy_modules_after_import']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Leftover-clearing combo suggestions.
+
+A combo is one serving each of MIN_ITEMS to MAX_ITEMS leftover items,
+sold together at a discount. It sells until its scarcest item runs
+out, so it clears min(leftover) servings of every item in it. Its
+clearance value is that count times the combo's summed cost, i.e. the
+cost of the leftovers it saves.
+
+suggest_combos() picks up to `limit` combos, no item in two of them,
+with the highest total clearance value. A greedy pass grows each combo
+from the item with the most leftovers, choosing among the next
+SEARCH_WINDOW items by leftovers. It grows a combo past MIN_ITEMS
+only once no further combo can be opened, since the items would
+otherwise earn more in a combo of their own. A local search then
+swaps, adds and drops items against the unused pool, swaps or moves
+items between combos, closes a combo when the others gain more from
+its items, and opens new combos from unused items, for as long as the
+total improves. Each move is scored for every candidate item at once
+with numpy, so hundreds of items solve in milliseconds. Moves change
+one item (or one combo) at a time, so some optima that need two items
+moved together are missed; benchmarks/bench_combos.py measures how
+often against a brute-force search.
+"""
+import os
+
+MIN_ITEMS = 3
+MAX_ITEMS = 5
+
+# Discounts the dashboard offers, in percent
+DISCOUNTS = [-3, -5, -10, -15, -20]
+
+SEARCH_WINDOW = int(os.environ.get("FF_COMBO_SEARCH_WINDOW", 40))
+MAX_PASSES = 50
+
+
+def combo_price(total_cost, discount):
+    return round(total_cost * (1 + discount / 100), 2)
+
+
+def suggest_combos(items, limit=5, discount=-10, max_price=None,
+                   min_items=MIN_ITEMS, max_items=MAX_ITEMS):
+    """
+    items     : list of {"menu_item", "leftover", "cost_per_item"}
+    discount  : percent the combos are priced at (negative is off)
+    max_price : highest combo price, after discount, or None
+
+    Returns the combos, best first, as {"items": [...], "total_cost",
+    "discount", "final_price", "combos_to_sell", "cleared_servings",
+    "clearance_value"}. An item listed twice has its leftovers added
+    up and its last cost used.
+    """
+    import numpy as np
+
+    merged = {}
+    for item in items:
+        if item["leftover"] > 0:
+            entry = merged.setdefault(item["menu_item"], dict(item, leftover=0))
+            entry["leftover"] += item["leftover"]
+            entry["cost_per_item"] = item["cost_per_item"]
+
+    items = list(merged.values())
+    leftover = np.array([item["leftover"] for item in items], dtype=float)
+    cost = np.array([item["cost_per_item"] for item in items], dtype=float)
+
+    # Highest summed cost a combo may have
+    factor = 1 + discount / 100
+    cost_cap = np.inf if max_price is None else max_price / factor if factor > 0 else np.inf
+
+    combos = _greedy(leftover, cost, cost_cap, limit, min_items, max_items)
+    combos = _local_search(combos, leftover, cost, cost_cap, limit, min_items, max_items)
+
+    results = []
+    for group in combos:
+        total_cost = round(float(cost[group].sum()), 2)
+        to_sell = int(leftover[group].min())
+        results.append({
+            "items": [items[i] for i in group],
+            "total_cost": total_cost,
+            "discount": discount,
+            "final_price": combo_price(total_cost, discount),
+            "combos_to_sell": to_sell,
+            "cleared_servings": to_sell * len(group),
+            "clearance_value": round(to_sell * total_cost, 2)
+        })
+
+    results.sort(key=lambda combo: -combo["clearance_value"])
+    return results
+
+
+def _value(group, leftover, cost):
+    return leftover[group].min() * cost[group].sum()
+
+
+def _greedy(leftover, cost, cost_cap, limit, min_items, max_items, pool=None):
+    import numpy as np
+
+    if pool is None:
+        pool = range(len(leftover))
+    unused = sorted((int(i) for i in pool), key=lambda i: -leftover[i])
+    combos = []
+
+    while len(combos) < limit and len(unused) >= min_items:
+        seed = unused.pop(0)
+        if cost[seed] > cost_cap:
+            continue
+
+        group = [seed]
+        low, total = leftover[seed], cost[seed]
+
+        while len(group) < max_items:
+            # Past the minimum size an item is worth more opening another
+            # combo, as long as one can still be opened
+            if len(group) >= min_items and len(combos) + 1 < limit and len(unused) >= min_items:
+                break
+
+            window = np.array(unused[:SEARCH_WINDOW], dtype=int)
+            if not len(window):
+                break
+
+            values = np.minimum(low, leftover[window]) * (total + cost[window])
+
+            # Below the minimum size, leave room under the cap for the
+            # cheapest items that still have to join
+            need = max(0, min_items - len(group) - 1)
+            cheapest = np.sort(cost[unused])[:need + 1]
+            reserve = np.where(
+                cost[window] <= cheapest[-1],
+                cheapest.sum() - cost[window],
+                cheapest[:need].sum()
+            ) if need else 0
+            values[total + cost[window] + reserve > cost_cap] = -1
+
+            best = int(np.argmax(values))
+            if values[best] < 0:
+                break
+
+            # Past the minimum size an item only joins if it adds value
+            if len(group) >= min_items and values[best] <= low * total:
+                break
+
+            j = unused.pop(best)
+            group.append(j)
+            low, total = min(low, leftover[j]), total + cost[j]
+
+        if len(group) >= min_items:
+            combos.append(group)
+        else:
+            # Could not be filled: give its items back, minus the seed
+            unused = sorted(unused + group[1:], key=lambda i: -leftover[i])
+
+    return combos
+
+
+def _local_search(combos, leftover, cost, cost_cap, limit, min_items, max_items):
+    import numpy as np
+
+    in_combo = {i for group in combos for i in group}
+    unused = np.array([i for i in range(len(leftover)) if i not in in_combo], dtype=int)
+
+    for _ in range(MAX_PASSES):
+        improved = False
+
+        for group in combos:
+            current = _value(group, leftover, cost)
+
+            # Best single move against the unused pool: swap an item
+            # out, add one, or drop one
+            best_value, best_move = current, None
+
+            for pos in range(len(group)):
+                others = group[:pos] + group[pos + 1:]
+                low, total = leftover[others].min(), cost[others].sum()
+
+                if len(unused):
+                    values = np.minimum(low, leftover[unused]) * (total + cost[unused])
+                    values[total + cost[unused] > cost_cap] = -1
+                    k = int(np.argmax(values))
+                    if values[k] > best_value:
+                        best_value, best_move = values[k], ("swap", pos, k)
+
+                if len(group) > min_items and low * total > best_value:
+                    best_value, best_move = low * total, ("drop", pos, None)
+
+            if len(group) < max_items and len(unused):
+                low, total = leftover[group].min(), cost[group].sum()
+                values = np.minimum(low, leftover[unused]) * (total + cost[unused])
+                values[total + cost[unused] > cost_cap] = -1
+                k = int(np.argmax(values))
+                if values[k] > best_value:
+                    best_value, best_move = values[k], ("add", None, k)
+
+            if best_move is None or best_value <= current * (1 + 1e-9):
+                continue
+
+            kind, pos, k = best_move
+            if kind == "swap":
+                group[pos], unused[k] = int(unused[k]), group[pos]
+            elif kind == "add":
+                group.append(int(unused[k]))
+                unused = np.delete(unused, k)
+            else:
+                unused = np.append(unused, group.pop(pos))
+
+            improved = True
+
+        # Move or swap one item between two combos
+        for a in range(len(combos)):
+            for b in range(a + 1, len(combos)):
+                if _exchange(combos[a], combos[b], leftover, cost, cost_cap, min_items, max_items):
+                    improved = True
+
+        # Close a combo and let the rest take its items, when one bigger
+        # combo beats two small ones
+        for pos in range(len(combos)):
+            closed = _close(combos, pos, unused, leftover, cost, cost_cap, max_items)
+            if closed is not None:
+                combos, unused = closed
+                improved = True
+                break
+
+        # Open new combos from the unused pool, which moves above may
+        # have refilled; any combo adds value
+        if len(combos) < limit and len(unused) >= min_items:
+            opened = _greedy(leftover, cost, cost_cap, limit - len(combos),
+                             min_items, max_items, pool=unused)
+            if opened:
+                combos.extend(opened)
+                used = {i for group in opened for i in group}
+                unused = np.array([i for i in unused if i not in used], dtype=int)
+                improved = True
+
+        if not improved:
+            break
+
+    return combos
+
+
+def _close(combos, pos, unused, leftover, cost, cost_cap, max_items):
+    # (combos, unused) without combos[pos], its items and the unused pool
+    # added one at a time wherever they gain most, or None if that is
+    # not better
+    import numpy as np
+
+    before = sum(_value(group, leftover, cost) for group in combos)
+    rest = [list(group) for i, group in enumerate(combos) if i != pos]
+    pool = np.concatenate([unused, combos[pos]]).astype(int)
+
+    while len(pool):
+        best_gain, best_move = 0, None
+
+        for g, group in enumerate(rest):
+            if len(group) >= max_items:
+                continue
+
+            low, total = leftover[group].min(), cost[group].sum()
+            gains = np.minimum(low, leftover[pool]) * (total + cost[pool]) - low * total
+            gains[total + cost[pool] > cost_cap] = -1
+
+            k = int(np.argmax(gains))
+            if gains[k] > best_gain:
+                best_gain, best_move = gains[k], (g, k)
+
+        if best_move is None:
+            break
+
+        g, k = best_move
+        rest[g].append(int(pool[k]))
+        pool = np.delete(pool, k)
+
+    if sum(_value(group, leftover, cost) for group in rest) <= before * (1 + 1e-9):
+        return None
+
+    return rest, pool
+
+
+def _exchange(first, second, leftover, cost, cost_cap, min_items, max_items):
+    def total():
+        return _value(first, leftover, cost) + _value(second, leftover, cost)
+
+    def fits():
+        return cost[first].sum() <= cost_cap and cost[second].sum() <= cost_cap
+
+    before = total() * (1 + 1e-9)
+
+    for i in range(len(first)):
+        for j in range(len(second)):
+            first[i], second[j] = second[j], first[i]
+
+            if fits() and total() > before:
+                return True
+
+            first[i], second[j] = second[j], first[i]
+
+    # Move one item across, when both combos keep a valid size
+    for source, target in ((first, second), (second, first)):
+        if len(source) <= min_items or len(target) >= max_items:
+            continue
+
+        for i in range(len(source)):
+            target.append(source.pop(i))
+
+            if fits() and total() > before:
+                return True
+
+            source.insert(i, target.pop())
+
+    return False
@@ -0,0 +1,103 @@
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+from metrics import connection_factory
+
+DATABASE = os.environ.get("FF_DATABASE", "database.db")
+
+# FF_DB_POOL=0 falls back to one plain connection per get_db() call
+POOLING = os.environ.get("FF_DB_POOL", "1") != "0"
+POOL_SIZE = int(os.environ.get("FF_DB_POOL_SIZE", 16))
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000"
+]
+
+_pool = queue.LifoQueue()
+_pool_pid = os.getpid()
+_local = threading.local()
+
+
+def connect():
+    # Connections are long lived, so sqlite3's per-connection statement
+    # cache keeps the prepared statements of every query we run
+    con = sqlite3.connect(
+        DATABASE,
+        timeout=30,
+        cached_statements=256,
+        check_same_thread=False,
+        factory=connection_factory()
+    )
+
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+
+    return con
+
+
+def _checkout():
+    global _pool, _pool_pid
+
+    # Connections must not cross a fork
+    if _pool_pid != os.getpid():
+        _pool = queue.LifoQueue()
+        _pool_pid = os.getpid()
+
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return connect()
+
+
+def _checkin(con):
+    if con.in_transaction:
+        con.rollback()
+
+    if _pool_pid == os.getpid() and _pool.qsize() < POOL_SIZE:
+        _pool.put(con)
+    else:
+        con.close()
+
+
+def get_db():
+    """
+    Connection for the current request (or thread, outside of Flask).
+
+    Use it as before: `with get_db() as con:` commits or rolls back on
+    exit but leaves the connection open for the rest of the request,
+    after which it goes back to the pool.
+    """
+    if not POOLING:
+        return sqlite3.connect(DATABASE, factory=connection_factory())
+
+    if has_app_context():
+        if "db" not in g:
+            g.db = _checkout()
+        return g.db
+
+    con = getattr(_local, "con", None)
+    if con is None or _local.pid != os.getpid():
+        con = connect()
+        _local.con = con
+        _local.pid = os.getpid()
+
+    return con
+
+
+def release_db(exception=None):
+    con = g.pop("db", None)
+    if con is not None:
+        _checkin(con)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
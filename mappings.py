@@ -0,0 +1,198 @@
+"""
+Recipe and staff mappings: one recipe_mapping row per restaurant, menu
+item and ingredient, one staff_mapping row per restaurant and menu
+item. Writes are upserts on those keys, batched through executemany,
+whether they come from the dashboard forms or a bulk CSV import.
+
+CSV imports take a header row naming at least the columns in
+RECIPE_COLUMNS / STAFF_COLUMNS, in any order:
+
+    menu_item,ingredient_name,qty_per_serving,unit
+    menu_item,base_servings,cooks,helpers,cleaners
+
+Files are streamed in chunks of IMPORT_CHUNK_ROWS in a single
+transaction, so an import of tens of thousands of rows either lands
+whole or not at all.
+"""
+import csv
+import io
+import json
+import os
+
+IMPORT_CHUNK_ROWS = int(os.environ.get("FF_IMPORT_CHUNK_ROWS", 5000))
+
+RECIPE_COLUMNS = ["menu_item", "ingredient_name", "qty_per_serving", "unit"]
+STAFF_COLUMNS = ["menu_item", "base_servings", "cooks", "helpers", "cleaners"]
+
+
+class MappingFileError(ValueError):
+    pass
+
+
+def upsert_recipes(con, restaurant_id, rows):
+    """
+    rows : iterable of (menu_item, ingredient_name, qty_per_serving, unit)
+    """
+    con.executemany("""
+        INSERT INTO recipe_mapping
+        (restaurant_id, menu_item, ingredient_name, qty_per_serving, unit)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (restaurant_id, menu_item, ingredient_name)
+        DO UPDATE SET
+            qty_per_serving = excluded.qty_per_serving,
+            unit = excluded.unit
+    """, ((restaurant_id, *row) for row in rows))
+
+
+def upsert_staff(con, restaurant_id, rows):
+    """
+    rows : iterable of (menu_item, base_servings, cooks, helpers, cleaners)
+    """
+    con.executemany("""
+        INSERT INTO staff_mapping
+        (restaurant_id, menu_item, base_servings, cooks, helpers, cleaners)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (restaurant_id, menu_item)
+        DO UPDATE SET
+            base_servings = excluded.base_servings,
+            cooks = excluded.cooks,
+            helpers = excluded.helpers,
+            cleaners = excluded.cleaners
+    """, ((restaurant_id, *row) for row in rows))
+
+
+def clear_recipes(con, restaurant_id, menu_items, keep=None):
+    """
+    Delete the recipes of menu_items, except (when given, for a single
+    item) the ingredient names in keep.
+    """
+    if keep is None:
+        con.execute("""
+            DELETE FROM recipe_mapping
+            WHERE restaurant_id = ?
+            AND menu_item IN (SELECT value FROM json_each(?))
+        """, (restaurant_id, json.dumps(list(menu_items))))
+        return
+
+    con.execute("""
+        DELETE FROM recipe_mapping
+        WHERE restaurant_id = ?
+        AND menu_item IN (SELECT value FROM json_each(?))
+        AND ingredient_name NOT IN (SELECT value FROM json_each(?))
+    """, (restaurant_id, json.dumps(list(menu_items)), json.dumps(list(keep))))
+
+
+def save_recipe(con, restaurant_id, menu_item, ingredients):
+    """
+    Make ingredients, a list of (ingredient_name, qty_per_serving,
+    unit), the item's whole recipe. Ingredients kept from the old
+    recipe are updated in place. Commits.
+    """
+    try:
+        clear_recipes(con, restaurant_id, [menu_item], keep=[name for name, _, _ in ingredients])
+        upsert_recipes(con, restaurant_id, ((menu_item, *row) for row in ingredients))
+    except Exception:
+        con.rollback()
+        raise
+
+    con.commit()
+
+
+def _read_rows(stream, columns, convert):
+    # Yields converted rows; the line number is 2 for the first data row
+    reader = csv.DictReader(stream)
+    line = 1
+
+    try:
+        missing = [col for col in columns if col not in (reader.fieldnames or [])]
+
+        if missing:
+            raise MappingFileError(f"CSV is missing column(s): {', '.join(missing)}")
+
+        for line, record in enumerate(reader, start=2):
+            # A short row leaves its missing columns as None
+            empty = [col for col in columns if record[col] is None]
+            if empty:
+                raise MappingFileError(f"Line {line}: no value for {', '.join(empty)}")
+
+            try:
+                row = convert(record)
+            except (TypeError, ValueError):
+                raise MappingFileError(f"Line {line}: invalid value in {record}")
+
+            if not row[0]:
+                raise MappingFileError(f"Line {line}: menu_item is empty")
+
+            yield row
+    except csv.Error as e:
+        raise MappingFileError(f"Line {line + 1}: {e}")
+
+
+def _recipe_row(record):
+    name = record["ingredient_name"].strip()
+    qty = float(record["qty_per_serving"])
+
+    if not name or qty < 0:
+        raise ValueError(record)
+
+    return (record["menu_item"].strip(), name, qty, record["unit"].strip())
+
+
+def _staff_row(record):
+    row = (
+        record["menu_item"].strip(),
+        *(int(record[col]) for col in STAFF_COLUMNS[1:])
+    )
+
+    if min(row[1:]) < 0:
+        raise ValueError(record)
+
+    return row
+
+
+def import_mappings(con, restaurant_id, kind, stream, replace=False):
+    """
+    Upsert every row of a recipes or staff CSV (a text stream) in one
+    transaction. With replace, an item's existing recipe is dropped the
+    first time the file mentions the item, so the file's ingredients
+    become the whole recipe. Raises MappingFileError, and changes
+    nothing, for a bad file. Returns {"rows", "menu_items"}.
+    """
+    if kind == "recipes":
+        rows = _read_rows(stream, RECIPE_COLUMNS, _recipe_row)
+        upsert = upsert_recipes
+    elif kind == "staff":
+        rows = _read_rows(stream, STAFF_COLUMNS, _staff_row)
+        upsert = upsert_staff
+    else:
+        raise MappingFileError(f"Unknown mapping kind: {kind}")
+
+    seen = set()
+    count = 0
+
+    try:
+        while True:
+            chunk = [row for _, row in zip(range(IMPORT_CHUNK_ROWS), rows)]
+            if not chunk:
+                break
+
+            new_items = {row[0] for row in chunk} - seen
+            if replace and kind == "recipes" and new_items:
+                clear_recipes(con, restaurant_id, new_items)
+
+            upsert(con, restaurant_id, chunk)
+
+            seen |= new_items
+            count += len(chunk)
+    except Exception:
+        con.rollback()
+        raise
+
+    con.commit()
+
+    return {"rows": count, "menu_items": len(seen)}
+
+
+def text_stream(file_storage):
+    # Uploaded files are bytes; csv wants text
+    return io.TextIOWrapper(file_storage.stream, encoding="utf-8-sig", newline="")
@@ -0,0 +1,285 @@
+"""
+Request, stage and query timings, exported as Prometheus text on
+/metrics.
+
+    FF_METRICS=0        instrumentation off: timed() is a no-op,
+                        connections are plain sqlite3 ones and requests
+                        are not timed
+    FF_SERVER_TIMING=1  also report each request's stages, queries and
+                        total in a Server-Timing response header
+    FF_METRICS_ALLOW    comma-separated addresses that may read /metrics
+                        (default: loopback only)
+
+Wrap a stage with `with timed("encode"):`. Numbers are per process;
+under several workers each exports its own, like any Prometheus
+client. Training runs in pool workers, so its durations are read from
+training_jobs at scrape time instead.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+from flask import g, has_request_context, request
+
+ENABLED = os.environ.get("FF_METRICS", "1") != "0"
+SERVER_TIMING = ENABLED and os.environ.get("FF_SERVER_TIMING", "0") == "1"
+
+# Addresses allowed to read /metrics
+ALLOWED_SCRAPERS = os.environ.get("FF_METRICS_ALLOW", "127.0.0.1,::1").split(",")
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram keyed by label values.
+    """
+
+    def __init__(self, name, help, labels, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            series = sorted(self._series.items())
+
+        for label_values, (counts, total, count) in series:
+            labels = list(zip(self.labels, label_values))
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(labels + [('le', bound)])} {n}")
+            lines.append(f"{self.name}_bucket{_labels(labels + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "ff_request_seconds", "Request latency.", ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "ff_stage_seconds", "Time spent in an instrumented stage.", ("stage",)
+)
+QUERY_SECONDS = Histogram(
+    "ff_sql_query_seconds", "SQLite statement execution time.", ("statement",)
+)
+REQUEST_QUERIES = Histogram(
+    "ff_request_sql_queries", "SQLite statements run per request.", ("route",),
+    buckets=QUERY_COUNT_BUCKETS
+)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Timer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.stage)
+
+        if SERVER_TIMING and has_request_context():
+            stages = g.setdefault("stage_seconds", {})
+            stages[self.stage] = stages.get(self.stage, 0) + elapsed
+
+
+_NOT_TIMED = nullcontext()
+
+
+def timed(stage):
+    """
+    Context manager timing one stage of the current request or job.
+    """
+    if not ENABLED:
+        return _NOT_TIMED
+
+    return _Timer(stage)
+
+
+def _record_query(sql, elapsed):
+    statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    QUERY_SECONDS.observe(elapsed, statement)
+
+    if has_request_context():
+        g.sql_queries = g.get("sql_queries", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0) + elapsed
+
+
+class TimedCursor(sqlite3.Cursor):
+    # Times the step that runs the statement; rows fetched afterwards
+    # are not counted
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute does not go through cursor(), so route it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """
+    The factory db.connect() should pass to sqlite3.connect().
+    """
+    return TimedConnection if ENABLED else sqlite3.Connection
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+
+
+def _finish_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    queries = g.get("sql_queries", 0)
+
+    REQUEST_SECONDS.observe(elapsed, request.method, route, str(response.status_code))
+    REQUEST_QUERIES.observe(queries, route)
+
+    if SERVER_TIMING:
+        entries = [
+            f"{stage};dur={seconds * 1000:.2f}"
+            for stage, seconds in g.get("stage_seconds", {}).items()
+        ]
+        entries.append(f'db;dur={g.get("sql_seconds", 0) * 1000:.2f};desc="{queries} queries"')
+        entries.append(f"total;dur={elapsed * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+    return response
+
+
+def init_app(app):
+    if ENABLED:
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
+
+
+def _gauges(name, help, values, label=None):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+
+    for key, value in values:
+        if value is not None:
+            lines.append(f"{name}{_labels([(label, key)] if label else [])} {value}")
+
+    return lines
+
+
+def training_lines():
+    """
+    Job counts and durations by status, across every process that
+    trained, from training_jobs.
+    """
+    from db import get_db
+
+    with get_db() as con:
+        rows = con.execute("""
+            SELECT status, COUNT(*), SUM(duration_seconds), COUNT(duration_seconds)
+            FROM training_jobs
+            GROUP BY status
+        """).fetchall()
+
+    lines = _gauges(
+        "ff_training_jobs", "Training jobs by status.",
+        [(status, count) for status, count, _, _ in rows], label="status"
+    )
+    lines += [
+        "# HELP ff_training_duration_seconds Training job duration.",
+        "# TYPE ff_training_duration_seconds summary"
+    ]
+    for status, _, total, timed_count in rows:
+        lines.append(f"ff_training_duration_seconds_sum{_labels([('status', status)])} {total or 0}")
+        lines.append(f"ff_training_duration_seconds_count{_labels([('status', status)])} {timed_count}")
+
+    return lines
+
+
+def cache_lines():
+    from ml.cache import model_cache, result_cache
+
+    lines = []
+
+    for prefix, stats in (("ff_model_cache", model_cache.stats()),
+                          ("ff_result_cache", result_cache.stats())):
+        for key, value in stats.items():
+            if key in ("hits", "misses", "reloads", "evictions", "expired"):
+                lines += [f"# TYPE {prefix}_{key}_total counter",
+                          f"{prefix}_{key}_total {value}"]
+            else:
+                lines += _gauges(f"{prefix}_{key}", f"{key.replace('_', ' ').capitalize()}.",
+                                 [(None, value)])
+
+    return lines
+
+
+def render():
+    """
+    Everything above as Prometheus text exposition.
+    """
+    lines = []
+
+    for histogram in (REQUEST_SECONDS, STAGE_SECONDS, QUERY_SECONDS, REQUEST_QUERIES):
+        lines += histogram.render()
+
+    lines += cache_lines()
+    lines += training_lines()
+
+    return "\n".join(lines) + "\n"
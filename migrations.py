@@ -0,0 +1,299 @@
+"""
+Versioned schema migrations.
+
+The schema version lives in SQLite's PRAGMA user_version. migrate()
+applies the missing migrations in order, each in its own write
+transaction, and is safe to run on every deploy and from several
+processes at once. Run it before starting the web workers:
+
+    flask --app app migrate
+    python migrations.py
+
+(`python app.py` migrates before serving.) The migrations up to
+create_forecast_cache only use IF NOT EXISTS and column checks, so
+databases created before versioning upgrade in place.
+"""
+from db import get_db
+
+
+def add_column_if_missing(cur, table, column, definition):
+    columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def create_core_tables(cur):
+    # Tables the app started with
+    cur.execute('''CREATE TABLE IF NOT EXISTS users(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS restaurants (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS feature_settings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    restaurant_id INTEGER NOT NULL,
+                    grocery_management BOOLEAN DEFAULT 0,
+                    staff_management BOOLEAN DEFAULT 0,
+                    combo_creation BOOLEAN DEFAULT 0,
+                    FOREIGN KEY (restaurant_id) REFERENCES restaurants(id) ON DELETE CASCADE
+                )''')
+    cur.execute("""CREATE TABLE IF NOT EXISTS predictions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prediction_uid TEXT,
+                    restaurant_id INTEGER,
+                    menu_item TEXT,
+                    predicted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    servings INTEGER
+                )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS recipe_mapping (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    restaurant_id INTEGER NOT NULL,
+                    menu_item TEXT NOT NULL,
+                    ingredient_name TEXT NOT NULL,
+                    qty_per_serving REAL NOT NULL,
+                    unit TEXT NOT NULL,
+                    FOREIGN KEY (restaurant_id) 
+                    REFERENCES restaurants(id) 
+                    ON DELETE CASCADE
+                 )""")
+    cur.execute(""" CREATE TABLE IF NOT EXISTS staff_mapping (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    restaurant_id INTEGER NOT NULL,
+                    menu_item TEXT NOT NULL,
+                    base_servings INTEGER NOT NULL,
+                    cooks INTEGER NOT NULL,
+                    helpers INTEGER NOT NULL,
+                    cleaners INTEGER NOT NULL,
+                    FOREIGN KEY (restaurant_id)
+                        REFERENCES restaurants(id)
+                        ON DELETE CASCADE
+                )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS staff_predictions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        restaurant_id INTEGER,
+                        menu_item TEXT,
+                        predicted_servings INTEGER,
+                        cooks INTEGER,
+                        helpers INTEGER,
+                        cleaners INTEGER,
+                        calculated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS combos (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        restaurant_id INTEGER,
+                        combo_name TEXT,
+                        items TEXT,
+                        total_cost REAL,
+                        discount_percent REAL,
+                        final_price REAL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (restaurant_id)
+                            REFERENCES restaurants(id)
+                            ON DELETE CASCADE
+                    )""")
+
+
+def create_training_jobs(cur):
+    # Background training queue
+    cur.execute("""CREATE TABLE IF NOT EXISTS training_jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        batch_id TEXT NOT NULL,
+                        restaurant_id INTEGER NOT NULL,
+                        menu_item TEXT NOT NULL,
+                        csv_path TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        error TEXT,
+                        queued_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        started_at DATETIME,
+                        finished_at DATETIME,
+                        duration_seconds REAL,
+                        FOREIGN KEY (restaurant_id)
+                            REFERENCES restaurants(id)
+                            ON DELETE CASCADE
+                    )""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_training_jobs_restaurant
+                    ON training_jobs (restaurant_id, id)""")
+
+
+def index_history_tables(cur):
+    # Keyset pagination indexes
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_predictions_restaurant_time
+                    ON predictions (restaurant_id, predicted_at, id)""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_staff_predictions_restaurant_time
+                    ON staff_predictions (restaurant_id, calculated_at, id)""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_combos_restaurant_time
+                    ON combos (restaurant_id, created_at, id)""")
+
+
+def create_model_registry(cur):
+    # Registry of trained models
+    cur.execute("""CREATE TABLE IF NOT EXISTS models (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        restaurant_id INTEGER NOT NULL,
+                        menu_item TEXT NOT NULL,
+                        version INTEGER NOT NULL,
+                        path TEXT NOT NULL,
+                        trained_at DATETIME,
+                        rows_used INTEGER,
+                        train_seconds REAL,
+                        size_bytes INTEGER,
+                        source_path TEXT,
+                        status TEXT NOT NULL DEFAULT 'ready',
+                        UNIQUE (restaurant_id, menu_item, version),
+                        FOREIGN KEY (restaurant_id)
+                            REFERENCES restaurants(id)
+                            ON DELETE CASCADE
+                    )""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_models_restaurant_status
+                    ON models (restaurant_id, status, menu_item)""")
+    # At most one current model per item
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_models_ready
+                    ON models (restaurant_id, menu_item)
+                    WHERE status = 'ready'""")
+
+
+def add_model_settings(cur):
+    # Estimator backends, model layouts and training data hashes
+    add_column_if_missing(cur, "models", "backend", "TEXT")
+    add_column_if_missing(cur, "models", "layout", "TEXT NOT NULL DEFAULT 'per_item'")
+    add_column_if_missing(cur, "models", "data_hash", "TEXT")
+    add_column_if_missing(cur, "feature_settings", "model_layout", "TEXT NOT NULL DEFAULT 'per_item'")
+    # Estimator per item; menu_item '' holds the restaurant-wide default
+    cur.execute("""CREATE TABLE IF NOT EXISTS model_settings (
+                        restaurant_id INTEGER NOT NULL,
+                        menu_item TEXT NOT NULL DEFAULT '',
+                        backend TEXT NOT NULL,
+                        PRIMARY KEY (restaurant_id, menu_item),
+                        FOREIGN KEY (restaurant_id)
+                            REFERENCES restaurants(id)
+                            ON DELETE CASCADE
+                    )""")
+
+
+def create_sales_history(cur):
+    # Row-level sales store filled by the chunked ingester
+    cur.execute("""CREATE TABLE IF NOT EXISTS sales_history (
+                        restaurant_id INTEGER NOT NULL,
+                        menu_item TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        meal_period TEXT NOT NULL,
+                        day_of_week TEXT NOT NULL,
+                        is_holiday INTEGER NOT NULL,
+                        weather TEXT NOT NULL,
+                        temperature REAL NOT NULL,
+                        sales_last_30d_avg REAL NOT NULL,
+                        servings REAL NOT NULL,
+                        PRIMARY KEY (restaurant_id, menu_item, date, meal_period)
+                    ) WITHOUT ROWID""")
+
+
+def create_forecast_cache(cur):
+    # Precomputed forecasts
+    cur.execute("""CREATE TABLE IF NOT EXISTS forecast_cache (
+                        restaurant_id INTEGER NOT NULL,
+                        menu_item TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        meal_period TEXT NOT NULL,
+                        weather TEXT NOT NULL,
+                        temperature REAL NOT NULL,
+                        is_holiday INTEGER NOT NULL,
+                        demand INTEGER NOT NULL,
+                        model_version INTEGER NOT NULL,
+                        computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (restaurant_id, menu_item, date, meal_period)
+                    ) WITHOUT ROWID""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_forecast_cache_date
+                    ON forecast_cache (restaurant_id, date)""")
+
+
+
+def index_recipe_mapping(cur):
+    # Recipes are always read per restaurant and menu item
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_recipe_mapping_item
+                    ON recipe_mapping (restaurant_id, menu_item)""")
+
+
+
+def unique_mappings(cur):
+    # One recipe row per ingredient and one staff row per item; the
+    # latest saved duplicate wins
+    cur.execute("""DELETE FROM recipe_mapping
+                    WHERE id NOT IN (
+                        SELECT MAX(id) FROM recipe_mapping
+                        GROUP BY restaurant_id, menu_item, ingredient_name
+                    )""")
+    cur.execute("""DELETE FROM staff_mapping
+                    WHERE id NOT IN (
+                        SELECT MAX(id) FROM staff_mapping
+                        GROUP BY restaurant_id, menu_item
+                    )""")
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_recipe_mapping_ingredient
+                    ON recipe_mapping (restaurant_id, menu_item, ingredient_name)""")
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_staff_mapping_item
+                    ON staff_mapping (restaurant_id, menu_item)""")
+    # Covered by the unique index's prefix
+    cur.execute("DROP INDEX IF EXISTS idx_recipe_mapping_item")
+
+
+# Append only: a migration's position is its schema version
+MIGRATIONS = [
+    create_core_tables,
+    create_training_jobs,
+    index_history_tables,
+    create_model_registry,
+    add_model_settings,
+    create_sales_history,
+    create_forecast_cache,
+    index_recipe_mapping,
+    unique_mappings
+]
+
+
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """
+    Bring the database up to the latest schema. Returns the versions
+    applied.
+    """
+    con = get_db()
+    applied = []
+
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if schema_version(con) >= version:
+            continue
+
+        # The write lock makes concurrent migrators take turns; whoever
+        # gets it second sees the new version and skips
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(con) < version:
+                migration(con.cursor())
+                con.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+
+    # Models trained before the registry existed
+    if not con.execute("SELECT COUNT(*) FROM models").fetchone()[0]:
+        from ml.registry import backfill
+
+        backfill()
+
+    return applied
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"Applied migration(s) {applied}" if applied else "Schema is up to date")
@@ -0,0 +1,532 @@
+"""
+On-disk model format.
+
+Each model (an item's, or a restaurant's __global__ one) has a home
+directory holding one directory per trained version. A version is
+written into a staging directory (.tmp-<id>) and renamed to v<UTC
+time>-<id> once complete, so a version directory never changes after
+it appears; the registry row then points readers at it. Old versions
+are removed by remove_old_versions() after a grace period.
+
+A version directory holds:
+
+    manifest.json   format version, model kind, feature order; written
+                    last, so its presence means the artifact is complete
+    encoders.json   category lookup table for each encoded column
+    *.npy           (forests) flattened tree arrays, loaded memory-mapped
+    model.joblib    (other estimators) the fitted estimator
+
+Forests are evaluated directly from the node arrays instead of being
+rebuilt as sklearn trees, which would copy every node onto the heap.
+Memory-mapped arrays stay in the page cache and are shared by every
+worker that loads the same artifact.
+
+Run `python -m ml.artifact migrate` to convert legacy model.pkl files,
+and `python -m ml.artifact gc` to remove old versions.
+"""
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ml.encoding import LookupEncoder, compile_encoder
+
+FORMAT_VERSION = 2
+
+MANIFEST = "manifest.json"
+
+TREE_ARRAYS = ["left", "right", "feature", "threshold", "value"]
+
+# Batch size from which ForestModel.predict uses sklearn's tree code
+NATIVE_ROWS = 32
+
+STAGING_PREFIX = ".tmp-"
+
+# Versions kept per model home besides the ones in use, and how long a
+# replaced version stays on disk for readers that looked it up just
+# before the swap
+KEEP_VERSIONS = int(os.environ.get("FF_KEEP_MODEL_VERSIONS", 2))
+GC_GRACE_SECONDS = float(os.environ.get("FF_MODEL_GC_GRACE", 300))
+
+# Staging directories this old belong to a training run that died
+STAGING_TTL_SECONDS = 3600
+
+
+class ForestModel:
+    """
+    Regression forest evaluated from flat node arrays.
+
+    Every tree's nodes live in one set of arrays; leaves point at
+    themselves. Small batches walk all trees at once in numpy, each
+    (tree, row) pair dropping out when it reaches a leaf. From
+    NATIVE_ROWS rows on, that costs several times sklearn's compiled
+    walk, so the trees are rebuilt once as sklearn Tree objects (a heap
+    copy of the nodes, kept on the model) and evaluated by those.
+    """
+
+    def __init__(self, roots, max_depth, left, right, feature, threshold, value):
+        self.roots = roots
+        self.max_depth = max_depth
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self._native = None
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def predict(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        if X.shape[0] >= NATIVE_ROWS:
+            return self._predict_native(X)
+
+        n_rows = X.shape[0]
+
+        # Tree-major: pair i is tree i // n_rows, row i % n_rows
+        nodes = np.repeat(self.roots, n_rows)
+        rows = np.tile(np.arange(n_rows), len(self.roots))
+        active = np.flatnonzero(self.left[nodes] != nodes)
+
+        for _ in range(self.max_depth):
+            if not len(active):
+                break
+
+            current = nodes[active]
+            go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+
+            nodes[active] = current
+            active = active[self.left[current] != current]
+
+        return self.value[nodes].reshape(len(self.roots), n_rows).mean(axis=0)
+
+    def _predict_native(self, X):
+        if self._native is None:
+            self._native = self._native_trees(X.shape[1])
+
+        total = np.zeros(X.shape[0])
+        for tree in self._native:
+            total += tree.predict(X).reshape(X.shape[0], -1)[:, 0]
+
+        return total / len(self._native)
+
+    def _native_trees(self, n_features):
+        from sklearn.tree._tree import NODE_DTYPE, Tree
+
+        trees = []
+        bounds = self.roots.tolist() + [len(self.left)]
+
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            left = np.asarray(self.left[start:end])
+            leaf = left == np.arange(start, end)
+
+            nodes = np.zeros(end - start, dtype=NODE_DTYPE)
+            nodes["left_child"] = np.where(leaf, -1, left - start)
+            nodes["right_child"] = np.where(leaf, -1, np.asarray(self.right[start:end]) - start)
+            nodes["feature"] = np.where(leaf, -2, self.feature[start:end])
+            nodes["threshold"] = np.where(leaf, -2, self.threshold[start:end])
+
+            tree = Tree(n_features, np.array([1], dtype=np.intp), 1)
+            tree.__setstate__({
+                "max_depth": int(self.max_depth),
+                "node_count": end - start,
+                "nodes": nodes,
+                "values": np.array(self.value[start:end]).reshape(-1, 1, 1)
+            })
+            trees.append(tree)
+
+        return trees
+
+
+def _flatten_forest(model):
+    trees = [est.tree_ for est in model.estimators_]
+    sizes = [tree.node_count for tree in trees]
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    left, right, feature, threshold, value = [], [], [], [], []
+
+    for root, tree in zip(roots, trees):
+        own = np.arange(tree.node_count) + root
+        leaf = tree.children_left == -1
+
+        left.append(np.where(leaf, own, tree.children_left + root))
+        right.append(np.where(leaf, own, tree.children_right + root))
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, 0.0, tree.threshold))
+        value.append(tree.value[:, 0, 0])
+
+    arrays = {
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.concatenate(value).astype(np.float64)
+    }
+
+    return roots, max(tree.max_depth for tree in trees), arrays
+
+
+def _save_array(path, array):
+    # Replace rather than overwrite: a worker may still have the old
+    # file memory-mapped, and truncating it under the mapping crashes it
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def _is_forest(model):
+    from sklearn.ensemble import RandomForestRegressor
+
+    return isinstance(model, RandomForestRegressor) and model.n_outputs_ == 1
+
+
+def save_artifact(output_dir, model, encoders, features):
+    """
+    Write model + encoders to output_dir. Returns the manifest path,
+    which is what the registry and the model cache point at.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "features": list(features)
+    }
+
+    if _is_forest(model):
+        roots, max_depth, arrays = _flatten_forest(model)
+        _write_forest(output_dir, roots, arrays)
+        manifest.update(kind="forest", max_depth=int(max_depth))
+    else:
+        import joblib
+
+        # Small estimators (linear, boosting) are fine as a plain pickle
+        joblib.dump(model, os.path.join(output_dir, "model.joblib"))
+        manifest["kind"] = "joblib"
+
+    return _finish_artifact(output_dir, manifest, encoders)
+
+
+def grow_forest(output_dir, model, encoders, max_trees, source_dir=None):
+    """
+    Add the trees of a freshly fitted forest to the forest artifact in
+    source_dir (default output_dir), dropping the oldest trees beyond
+    max_trees, and write the result to output_dir. Returns the manifest
+    path.
+
+    encoders may have grown since the artifact was written: the old
+    trees' splits on encoded columns are re-coded to the new vocabulary,
+    so they still route every category they have seen the same way.
+    """
+    old = load_artifact(os.path.join(source_dir or output_dir, MANIFEST), mmap=False)
+    forest = old["model"]
+    features = old["features"]
+
+    left = np.asarray(forest.left)
+    right = np.asarray(forest.right)
+    feature = np.asarray(forest.feature)
+    threshold = np.array(forest.threshold)
+
+    internal = left != np.arange(len(left))
+
+    for i, col in enumerate(features):
+        if col not in encoders:
+            continue
+
+        # A split "code <= k + 0.5" keeps old classes 0..k on the left
+        new_codes = np.searchsorted(encoders[col].classes_, old["encoders"][col].classes_)
+        split = internal & (feature == i)
+        threshold[split] = new_codes[np.floor(threshold[split]).astype(np.int64)] + 0.5
+
+    roots, max_depth, arrays = _flatten_forest(model)
+
+    # Keep the newest trees; nodes of the dropped ones are cut off the front
+    keep = min(len(forest.roots), max(0, max_trees - len(roots)))
+    kept_roots = forest.roots[len(forest.roots) - keep:] if keep else forest.roots[:0]
+    start = kept_roots[0] if keep else len(left)
+    offset = len(left) - start
+
+    arrays = {
+        "left": np.concatenate([left[start:] - start, arrays["left"] + offset]),
+        "right": np.concatenate([right[start:] - start, arrays["right"] + offset]),
+        "feature": np.concatenate([feature[start:], arrays["feature"]]),
+        "threshold": np.concatenate([threshold[start:], arrays["threshold"]]),
+        "value": np.concatenate([np.asarray(forest.value)[start:], arrays["value"]])
+    }
+    roots = np.concatenate([kept_roots - start, roots + offset]).astype(np.int64)
+
+    for name in ("left", "right", "feature"):
+        arrays[name] = arrays[name].astype(np.int32)
+
+    _write_forest(output_dir, roots, arrays)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "features": features,
+        "kind": "forest",
+        "max_depth": int(max(forest.max_depth, max_depth))
+    }
+
+    return _finish_artifact(output_dir, manifest, encoders)
+
+
+def _write_forest(output_dir, roots, arrays):
+    os.makedirs(output_dir, exist_ok=True)
+
+    for name, array in dict(arrays, roots=roots).items():
+        _save_array(os.path.join(output_dir, f"{name}.npy"), array)
+
+
+def _finish_artifact(output_dir, manifest, encoders):
+    with open(os.path.join(output_dir, "encoders.json"), "w") as f:
+        json.dump({
+            col: compile_encoder(encoder).to_json()
+            for col, encoder in encoders.items()
+        }, f)
+
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Drop files left by a previous model of the other kind
+    if manifest["kind"] == "forest":
+        stale = ["model.joblib"]
+    else:
+        stale = [f"{name}.npy" for name in TREE_ARRAYS + ["roots"]]
+
+    for name in stale:
+        if os.path.exists(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+
+    return manifest_path
+
+
+def staging_dir(model_home):
+    """
+    Where to write a new version of the model in model_home. The
+    directory is created by the first write; nothing reads it until
+    publish() renames it.
+    """
+    return os.path.join(model_home, f"{STAGING_PREFIX}{uuid.uuid4().hex}")
+
+
+def publish(staging):
+    """
+    Rename a complete staging directory to a new version directory next
+    to it and return that version's manifest path. The rename is atomic,
+    so the version is either absent or whole.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    version_dir = os.path.join(os.path.dirname(staging), f"v{stamp}-{uuid.uuid4().hex[:8]}")
+
+    os.rename(staging, version_dir)
+
+    return os.path.join(version_dir, MANIFEST)
+
+
+def version_dirs(model_home):
+    """
+    Published version directories in model_home, oldest first.
+    """
+    try:
+        entries = list(os.scandir(model_home))
+    except FileNotFoundError:
+        return []
+
+    return sorted(
+        entry.path
+        for entry in entries
+        if entry.is_dir() and entry.name.startswith("v")
+        and os.path.exists(os.path.join(entry.path, MANIFEST))
+    )
+
+
+def latest_artifact_dir(model_home):
+    """
+    The newest complete artifact in model_home: its latest version, or
+    the home itself for a model written before versions. None if there
+    is none.
+    """
+    versions = version_dirs(model_home)
+    if versions:
+        return versions[-1]
+
+    if os.path.exists(os.path.join(model_home, MANIFEST)):
+        return model_home
+
+    return None
+
+
+def remove_old_versions(model_home, in_use=(), keep=KEEP_VERSIONS, grace=GC_GRACE_SECONDS):
+    """
+    Delete the versions in model_home that are neither in use (a set of
+    absolute version directory paths) nor among the newest `keep`, once `grace`
+    seconds have passed since the next version replaced them, and
+    staging directories abandoned by a dead training run. Readers that
+    already loaded a deleted version keep working: its memory-mapped
+    files live on until they are unmapped. Returns the number removed.
+    """
+    now = time.time()
+    versions = version_dirs(model_home)
+    removed = 0
+
+    for old, newer in zip(versions[:-keep] if keep else versions, versions[1:]):
+        if os.path.abspath(old) in in_use:
+            continue
+
+        # The newer version's manifest is written last: when it replaced this one
+        replaced_at = os.path.getmtime(os.path.join(newer, MANIFEST))
+        if now - replaced_at < grace:
+            continue
+
+        shutil.rmtree(old, ignore_errors=True)
+        removed += 1
+
+    staging = [
+        entry.path
+        for entry in os.scandir(model_home)
+        if entry.is_dir() and entry.name.startswith(STAGING_PREFIX)
+    ] if os.path.isdir(model_home) else []
+
+    for path in staging:
+        if now - os.path.getmtime(path) > STAGING_TTL_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+
+    return removed
+
+
+def load_artifact(path, mmap=True):
+    """
+    Load a bundle ({"model", "encoders"}) from a manifest path. Legacy
+    model.pkl paths are still accepted and unpickled as before.
+    """
+    if path.endswith(".pkl"):
+        import joblib
+
+        bundle = joblib.load(path)
+        bundle["encoders"] = {
+            col: compile_encoder(encoder)
+            for col, encoder in bundle["encoders"].items()
+        }
+        return bundle
+
+    output_dir = os.path.dirname(path)
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format: {manifest.get('format')}")
+
+    if manifest["kind"] == "forest":
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(output_dir, f"{name}.npy"), mmap_mode=mode)
+            for name in TREE_ARRAYS
+        }
+        model = ForestModel(
+            roots=np.load(os.path.join(output_dir, "roots.npy")),
+            max_depth=manifest["max_depth"],
+            **arrays
+        )
+    else:
+        import joblib
+
+        model = joblib.load(os.path.join(output_dir, "model.joblib"))
+
+    with open(os.path.join(output_dir, "encoders.json")) as f:
+        encoders = {
+            col: LookupEncoder.from_json(state)
+            for col, state in json.load(f).items()
+        }
+
+    return {
+        "model": model,
+        "encoders": encoders,
+        "features": manifest["features"]
+    }
+
+
+def artifact_size(path):
+    """
+    Bytes on disk for the artifact a registry path points at.
+    """
+    if path.endswith(".pkl"):
+        return os.path.getsize(path)
+
+    output_dir = os.path.dirname(path)
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(output_dir)
+        if entry.is_file() and entry.name != "meta.json"
+    )
+
+
+def migrate(remove_pickles=True):
+    """
+    Convert every registered model.pkl into the current format and point
+    the registry at the new artifact. Returns the number converted.
+    """
+    from db import get_db
+    from ml.features import FEATURES
+
+    with get_db() as con:
+        rows = con.execute("""
+            SELECT id, path
+            FROM models
+            WHERE path LIKE '%.pkl'
+            AND status IN ('ready', 'superseded')
+        """).fetchall()
+
+    import joblib
+
+    converted = 0
+
+    for model_id, path in rows:
+        if not os.path.exists(path):
+            continue
+
+        bundle = joblib.load(path)
+        manifest_path = save_artifact(
+            os.path.dirname(path),
+            bundle["model"],
+            bundle["encoders"],
+            FEATURES
+        )
+
+        with get_db() as con:
+            con.execute("""
+                UPDATE models
+                SET path = ?, size_bytes = ?
+                WHERE path = ?
+            """, (manifest_path, artifact_size(manifest_path), path))
+            con.commit()
+
+        if remove_pickles:
+            os.remove(path)
+
+        converted += 1
+
+    return converted
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        print(f"Migrated {migrate()} model(s)")
+    elif sys.argv[1:] == ["gc"]:
+        from ml.registry import collect_garbage
+
+        print(f"Removed {collect_garbage()} old model version(s)")
+    else:
+        sys.exit("usage: python -m ml.artifact migrate|gc")
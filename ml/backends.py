@@ -0,0 +1,133 @@
+"""
+Estimators a demand model can be trained with, and how a restaurant's
+models are laid out.
+
+The backend is chosen per item, falling back to a per-restaurant
+default, falling back to FF_DEFAULT_BACKEND ("rf", the original
+200-tree forest). The layout is per restaurant: one model per item, or
+one global model with the item as a feature.
+"""
+import os
+
+BACKENDS = {
+    # The original model
+    "rf": {
+        "label": "Random Forest (200 trees)",
+        "estimator": "RandomForestRegressor",
+        "params": {"n_estimators": 200, "random_state": 42}
+    },
+    # Same forest, fitted on every core. Best for one-off retrains; bulk
+    # uploads already train one item per core in the job queue
+    "rf_parallel": {
+        "label": "Random Forest (200 trees, all cores)",
+        "estimator": "RandomForestRegressor",
+        "params": {"n_estimators": 200, "random_state": 42, "n_jobs": -1}
+    },
+    # Fewer, shallower trees: faster to fit, smaller artifact, fewer
+    # steps per prediction
+    "rf_small": {
+        "label": "Random Forest (50 trees)",
+        "estimator": "RandomForestRegressor",
+        "params": {"n_estimators": 50, "max_depth": 12, "random_state": 42}
+    },
+    "hgb": {
+        "label": "Histogram Gradient Boosting",
+        "estimator": "HistGradientBoostingRegressor",
+        "params": {"random_state": 42}
+    },
+    "linear": {
+        "label": "Linear baseline",
+        "estimator": "LinearRegression",
+        "params": {}
+    }
+}
+
+DEFAULT_BACKEND = os.environ.get("FF_DEFAULT_BACKEND", "rf")
+
+
+def make_estimator(backend):
+    from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+    from sklearn.linear_model import LinearRegression
+
+    classes = {
+        "RandomForestRegressor": RandomForestRegressor,
+        "HistGradientBoostingRegressor": HistGradientBoostingRegressor,
+        "LinearRegression": LinearRegression
+    }
+
+    spec = BACKENDS[backend]
+    return classes[spec["estimator"]](**spec["params"])
+
+
+def resolve_backend(restaurant_id, menu_item):
+    """
+    Item setting, else restaurant default ('' item), else DEFAULT_BACKEND.
+    """
+    from db import get_db
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT backend
+            FROM model_settings
+            WHERE restaurant_id = ?
+            AND menu_item IN (?, '')
+            ORDER BY menu_item = ''
+            LIMIT 1
+        """, (restaurant_id, menu_item))
+        row = cur.fetchone()
+
+    if row is None or row[0] not in BACKENDS:
+        return DEFAULT_BACKEND
+
+    return row[0]
+
+
+def set_backend(restaurant_id, backend, menu_item=""):
+    from db import get_db
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    with get_db() as con:
+        con.execute("""
+            INSERT INTO model_settings (restaurant_id, menu_item, backend)
+            VALUES (?, ?, ?)
+            ON CONFLICT (restaurant_id, menu_item)
+            DO UPDATE SET backend = excluded.backend
+        """, (restaurant_id, menu_item, backend))
+        con.commit()
+
+
+LAYOUTS = {
+    "per_item": "One model per menu item",
+    "global": "One model for the whole restaurant"
+}
+
+
+def resolve_layout(restaurant_id):
+    from db import get_db
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT model_layout
+            FROM feature_settings
+            WHERE restaurant_id = ?
+        """, (restaurant_id,))
+        row = cur.fetchone()
+
+    return row[0] if row and row[0] in LAYOUTS else "per_item"
+
+
+def set_layout(restaurant_id, layout):
+    from db import get_db
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown model layout: {layout}")
+
+    with get_db() as con:
+        con.execute("""
+            UPDATE feature_settings
+            SET model_layout = ?
+            WHERE restaurant_id = ?
+        """, (layout, restaurant_id))
+        con.commit()
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import timed
+from ml.artifact import artifact_size, load_artifact
+
+
+class ModelCache:
+    """
+    Bounded LRU cache of loaded model bundles.
+
+    Entries are keyed by (restaurant_id, menu_item) and remember the
+    (path, mtime, size) stamp of the file they were loaded from, so a
+    retrained model is picked up on the next lookup. The on-disk size of each
+    artifact is used as its memory cost when enforcing max_bytes (an
+    upper bound for memory-mapped forests, which share the page cache).
+    """
+
+    def __init__(self, max_bytes, loader=load_artifact):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, key, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(key)
+            return None
+
+        stamp = (path, st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+
+        # Unpickling is the slow part, keep it outside the lock
+        with timed("model_load"):
+            bundle = self.loader(path)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            size = artifact_size(path)
+            self._entries[key] = (stamp, bundle, size)
+            self._bytes += size
+            self._evict()
+
+        return bundle
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone
+        # is over budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_ratio": hit_ratio(self.hits, self.misses + self.reloads)
+            }
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of prediction results with a time-to-live.
+
+    Keys are (restaurant_id, menu_item, model_id, features): model_id is
+    the registry row of the model that made the prediction, so a retrain
+    never serves an old result, and features is the full input tuple,
+    sales_last_30d_avg included. invalidate() drops an item's results
+    outright when its sales change.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+                self.expired += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock() + self.ttl, value)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, restaurant_id, menu_item):
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == (restaurant_id, menu_item)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_ratio": hit_ratio(self.hits, self.misses)
+            }
+
+
+def hit_ratio(hits, misses):
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+model_cache = ModelCache(
+    max_bytes=int(os.environ.get("FF_MODEL_CACHE_BYTES", 512 * 1024 * 1024))
+)
+
+# FF_RESULT_CACHE_SIZE=0 turns result caching off
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("FF_RESULT_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("FF_RESULT_CACHE_TTL", 3600))
+)
@@ -0,0 +1,118 @@
+"""
+Category encoding for model inputs.
+
+Encoders are compiled at training time into plain {category: code}
+tables, stored in the artifact's encoders.json and applied with dict
+lookups: one per value for a single prediction, one pandas map per
+column for a batch. Codes are the sorted-vocabulary positions a
+LabelEncoder would give, so models trained either way read the same
+inputs.
+
+What happens to a category the model never saw is set by
+FF_UNKNOWN_CATEGORY:
+
+    error          (default) the row is rejected
+    most_frequent  the row is encoded as the column's most frequent
+                   training category
+"""
+import os
+
+import numpy as np
+
+UNKNOWN_POLICIES = ("error", "most_frequent")
+
+UNKNOWN_POLICY = os.environ.get("FF_UNKNOWN_CATEGORY", "error")
+
+# Fail at startup, not on every lookup
+if UNKNOWN_POLICY not in UNKNOWN_POLICIES:
+    raise ValueError(
+        f"FF_UNKNOWN_CATEGORY must be one of {', '.join(UNKNOWN_POLICIES)}, "
+        f"not {UNKNOWN_POLICY!r}"
+    )
+
+
+class UnknownCategory(ValueError):
+    pass
+
+
+class LookupEncoder:
+    """
+    Category -> code table for one column.
+    """
+
+    def __init__(self, classes, most_frequent=None):
+        self.classes_ = np.asarray(sorted(classes))
+        self.codes = {value: code for code, value in enumerate(self.classes_.tolist())}
+        self.most_frequent = most_frequent
+
+    @classmethod
+    def fit(cls, values):
+        import pandas as pd
+
+        counts = pd.Series(values).astype(str).value_counts()
+        return cls(counts.index.tolist(), counts.index[0] if len(counts) else None)
+
+    def fallback(self, policy):
+        if policy not in UNKNOWN_POLICIES:
+            raise ValueError(f"Unknown category policy: {policy}")
+
+        if policy == "most_frequent" and self.most_frequent is not None:
+            return self.codes[self.most_frequent]
+
+        return None
+
+    def code(self, value, policy=UNKNOWN_POLICY):
+        code = self.codes.get(str(value))
+
+        if code is None:
+            code = self.fallback(policy)
+
+        if code is None:
+            raise UnknownCategory(f"Unknown category: {value}")
+
+        return code
+
+    def encode(self, values, policy=UNKNOWN_POLICY):
+        """
+        Codes for a batch as a float array; unknown values are NaN under
+        the "error" policy, so callers can reject just those rows.
+        """
+        import pandas as pd
+
+        codes = np.array(pd.Series(values).astype(str).map(self.codes), dtype=float)
+
+        fallback = self.fallback(policy)
+        if fallback is not None:
+            codes[np.isnan(codes)] = fallback
+
+        return codes
+
+    def transform(self, values):
+        # LabelEncoder-compatible: unseen values are an error
+        codes = self.encode(values, policy="error")
+
+        if np.isnan(codes).any():
+            raise UnknownCategory("y contains previously unseen labels")
+
+        return codes.astype(np.int64)
+
+    def to_json(self):
+        return {"codes": self.codes, "most_frequent": self.most_frequent}
+
+    @classmethod
+    def from_json(cls, state):
+        # Artifacts written before lookup tables stored the bare vocabulary
+        if isinstance(state, list):
+            return cls(state)
+
+        return cls(state["codes"], state.get("most_frequent"))
+
+
+def compile_encoder(encoder):
+    """
+    LookupEncoder for a fitted sklearn LabelEncoder (legacy bundles).
+    """
+    if isinstance(encoder, LookupEncoder):
+        return encoder
+
+    return LookupEncoder([c.item() if hasattr(c, "item") else c for c in encoder.classes_])
@@ -0,0 +1,18 @@
+# Model inputs, in the column order every model is trained with
+FEATURES = [
+    "day_of_week",
+    "meal_period",
+    "is_holiday",
+    "weather",
+    "temperature",
+    "sales_last_30d_avg"
+]
+
+# What the models predict
+TARGET = "no_of_servings"
+
+# Columns label-encoded before training
+CATEGORICAL = ["day_of_week", "meal_period", "weather"]
+
+# A restaurant-wide model also sees which item it is predicting
+GLOBAL_FEATURES = ["menu_item"] + FEATURES
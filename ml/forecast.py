@@ -0,0 +1,226 @@
+"""
+Precomputed demand forecasts.
+
+refresh_forecasts() predicts the next N days x every trained item x
+every meal period the item sells in, under default weather, temperature
+and holiday assumptions, and stores the results in forecast_cache.
+/predict and the dashboard read that table first and only run a model
+for inputs it does not cover.
+
+    python -m ml.forecast --days 7                # refresh once
+    python -m ml.forecast --days 7 --every 3600   # and then every hour
+
+Restaurants are forecast in parallel on a process pool
+(FF_FORECAST_WORKERS, default one per core); each restaurant is one
+batched prediction.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from db import get_db
+
+FORECAST_DAYS = int(os.environ.get("FF_FORECAST_DAYS", 7))
+
+# The assumptions a forecast is made under; a /predict request with
+# other inputs is predicted live
+DEFAULT_WEATHER = os.environ.get("FF_FORECAST_WEATHER", "Sunny")
+DEFAULT_TEMPERATURE = float(os.environ.get("FF_FORECAST_TEMPERATURE", 25))
+DEFAULT_HOLIDAY = 0
+
+# Items without ingested sales history
+DEFAULT_MEAL_PERIODS = ["Lunch", "Dinner"]
+
+
+def forecast_restaurant(restaurant_id, days=FORECAST_DAYS, start=None):
+    """
+    Replace one restaurant's forecasts with fresh ones for `days` days
+    from start (default today). Returns the number of forecasts stored.
+    """
+    from ml.predict import predict_batch
+    from ml.registry import current_models, trained_menu_items
+    from sales import last_30d_avg
+
+    start = start or date.today()
+    dates = [start + timedelta(days=n) for n in range(days)]
+
+    models = current_models(restaurant_id, trained_menu_items(restaurant_id))
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT menu_item, meal_period
+            FROM sales_history
+            WHERE restaurant_id = ?
+            GROUP BY menu_item, meal_period
+        """, (restaurant_id,))
+        meal_periods = {}
+        for menu_item, meal_period in cur.fetchall():
+            meal_periods.setdefault(menu_item, []).append(meal_period)
+
+        averages = {
+            menu_item: last_30d_avg(con, restaurant_id, menu_item) or 0
+            for menu_item in models
+        }
+
+    rows = [
+        {
+            "menu_item": menu_item,
+            "date": day.isoformat(),
+            "day_of_week": day.strftime("%A"),
+            "meal_period": meal_period,
+            "is_holiday": DEFAULT_HOLIDAY,
+            "weather": DEFAULT_WEATHER,
+            "temperature": DEFAULT_TEMPERATURE,
+            "sales_last_30d_avg": averages[menu_item]
+        }
+        for menu_item in models
+        for meal_period in meal_periods.get(menu_item, DEFAULT_MEAL_PERIODS)
+        for day in dates
+    ]
+
+    results = predict_batch(restaurant_id, rows) if rows else None
+    predicted = [] if results is None else [
+        (restaurant_id, row.menu_item, row.date, row.meal_period, DEFAULT_WEATHER,
+         DEFAULT_TEMPERATURE, DEFAULT_HOLIDAY, int(row.demand), models[row.menu_item]["version"])
+        for row in results[results["error"].isna()].itertuples()
+    ]
+
+    with get_db() as con:
+        con.execute("""
+            DELETE FROM forecast_cache
+            WHERE restaurant_id = ?
+        """, (restaurant_id,))
+        con.executemany("""
+            INSERT INTO forecast_cache
+            (restaurant_id, menu_item, date, meal_period, weather,
+             temperature, is_holiday, demand, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, predicted)
+        con.commit()
+
+    return len(predicted)
+
+
+def refresh_forecasts(days=FORECAST_DAYS, workers=None):
+    """
+    Recompute forecasts for every restaurant with a trained model.
+    Returns {restaurant_id: forecasts stored}.
+    """
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT DISTINCT restaurant_id
+            FROM models
+            WHERE status = 'ready'
+        """)
+        restaurant_ids = [row[0] for row in cur.fetchall()]
+
+    workers = workers or int(os.environ.get("FF_FORECAST_WORKERS", os.cpu_count() or 1))
+
+    if workers == 1 or len(restaurant_ids) <= 1:
+        counts = [forecast_restaurant(rid, days) for rid in restaurant_ids]
+    else:
+        # spawn, as for training: workers open their own sqlite handles
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(restaurant_ids)),
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            counts = list(pool.map(forecast_restaurant, restaurant_ids, [days] * len(restaurant_ids)))
+
+    return dict(zip(restaurant_ids, counts))
+
+
+def cached_prediction(restaurant_id, menu_item, day, meal_period, weather,
+                      temperature, is_holiday):
+    """
+    The stored forecast for exactly these inputs, in predict_demand's
+    result format, or None. Forecasts made by a model that has since
+    been replaced are ignored.
+    """
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT f.demand
+            FROM forecast_cache f
+            JOIN models m
+                ON m.restaurant_id = f.restaurant_id
+                AND m.menu_item = f.menu_item
+                AND m.status = 'ready'
+                AND m.version = f.model_version
+            WHERE f.restaurant_id = ?
+            AND f.menu_item = ?
+            AND f.date = ?
+            AND f.meal_period = ?
+            AND f.weather = ?
+            AND f.temperature = ?
+            AND f.is_holiday = ?
+        """, (restaurant_id, menu_item, day, meal_period, weather, temperature, is_holiday))
+        row = cur.fetchone()
+
+    if row is None:
+        return None
+
+    return {
+        "id": f"{menu_item}_{int(time.time())}",
+        "menu_item": menu_item,
+        "demand": row[0],
+        "source": "forecast"
+    }
+
+
+def upcoming_forecasts(restaurant_id, days=2):
+    """
+    (date, meal_period, menu_item, demand) rows from today on, for the
+    dashboard.
+    """
+    today = date.today()
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT f.date, f.meal_period, f.menu_item, f.demand
+            FROM forecast_cache f
+            JOIN models m
+                ON m.restaurant_id = f.restaurant_id
+                AND m.menu_item = f.menu_item
+                AND m.status = 'ready'
+                AND m.version = f.model_version
+            WHERE f.restaurant_id = ?
+            AND f.date >= ?
+            AND f.date < ?
+            ORDER BY f.date, f.meal_period, f.menu_item
+        """, (restaurant_id, today.isoformat(), (today + timedelta(days=days)).isoformat()))
+        return cur.fetchall()
+
+
+def invalidate_forecasts(con, restaurant_id, menu_item):
+    # New sales history changes the 30-day average the forecasts used
+    con.execute("""
+        DELETE FROM forecast_cache
+        WHERE restaurant_id = ?
+        AND menu_item = ?
+    """, (restaurant_id, menu_item))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m ml.forecast")
+    parser.add_argument("--days", type=int, default=FORECAST_DAYS)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--every", type=int, metavar="SECONDS",
+                        help="keep running, refreshing this often")
+    args = parser.parse_args()
+
+    while True:
+        started = time.time()
+        counts = refresh_forecasts(args.days, args.workers)
+        print(f"Stored {sum(counts.values())} forecast(s) for {len(counts)} "
+              f"restaurant(s) in {time.time() - started:.1f}s", flush=True)
+
+        if not args.every:
+            break
+
+        time.sleep(max(0, args.every - (time.time() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from db import get_db
+
+# A job still queued or running after this many seconds belongs to a
+# worker or server that died, and is reported failed
+STALE_JOB_SECONDS = int(os.environ.get("FF_TRAIN_TIMEOUT", 3600))
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+
+    # A worker that dies mid-task (e.g. OOM-killed) breaks the whole
+    # pool: every later submit raises, so start a fresh one
+    if _executor is not None and getattr(_executor, "_broken", False):
+        _executor.shutdown(wait=False)
+        _executor = None
+
+    if _executor is None:
+        # spawn, not fork: the web process has threads and open sqlite handles
+        _executor = ProcessPoolExecutor(
+            max_workers=int(os.environ.get("FF_TRAIN_WORKERS", os.cpu_count() or 1)),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    return _executor
+
+
+def enqueue_training(restaurant_id, items):
+    """
+    restaurant_id : int
+    items         : list of (menu_item, csv_path)
+
+    Records one job per item and hands the ones that need training to
+    the process pool: one task per item, or for a restaurant on the
+    global layout a single task retraining its shared model. Items whose
+    upload matches what their current model was trained on are recorded
+    as 'reused' and not retrained. Returns the batch id shared by the
+    jobs.
+    """
+    from ml.backends import resolve_layout
+
+    layout = resolve_layout(restaurant_id)
+    unchanged = unchanged_items(restaurant_id, items, layout)
+
+    # The shared model is rebuilt from every item, so one change retrains it
+    if layout == "global" and len(unchanged) < len(items):
+        unchanged = set()
+
+    batch_id = uuid.uuid4().hex
+    jobs = []
+
+    with get_db() as con:
+        cur = con.cursor()
+        for menu_item, csv_path in items:
+            if menu_item in unchanged:
+                cur.execute("""
+                    INSERT INTO training_jobs
+                    (batch_id, restaurant_id, menu_item, csv_path, status,
+                     started_at, finished_at, duration_seconds)
+                    VALUES (?, ?, ?, ?, 'reused', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 0)
+                """, (batch_id, restaurant_id, menu_item, csv_path))
+                continue
+
+            cur.execute("""
+                INSERT INTO training_jobs
+                (batch_id, restaurant_id, menu_item, csv_path, status)
+                VALUES (?, ?, ?, ?, 'queued')
+            """, (batch_id, restaurant_id, menu_item, csv_path))
+            jobs.append((cur.lastrowid, menu_item, csv_path))
+        con.commit()
+
+    if not jobs:
+        return batch_id
+
+    if layout == "global":
+        from ml.registry import training_sources
+
+        sources = training_sources(restaurant_id)
+        sources.update(items)
+
+        job_ids = [job_id for job_id, _, _ in jobs]
+        _submit(job_ids, run_global_job, job_ids, restaurant_id, sources)
+        return batch_id
+
+    for job_id, menu_item, csv_path in jobs:
+        _submit([job_id], run_job, job_id, restaurant_id, menu_item, csv_path)
+
+    return batch_id
+
+
+def _submit(job_ids, fn, *args):
+    # The jobs are already committed as queued: if they cannot be handed
+    # to the pool they are failed, not left queued forever
+    global _executor
+
+    try:
+        try:
+            future = get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # Broke after get_executor() looked; one retry on a new pool
+            _executor = None
+            future = get_executor().submit(fn, *args)
+    except Exception as e:
+        _fail(job_ids, f"Could not start training: {e}")
+        return
+
+    future.add_done_callback(partial(_on_done, job_ids))
+
+
+def unchanged_items(restaurant_id, items, layout):
+    """
+    Menu items whose uploaded CSV hashes to the data_hash of their
+    current model, i.e. same rows, same backend and same layout. Items
+    still being trained are never unchanged: the model they will end up
+    with is not the current one.
+    """
+    from ml.backends import resolve_backend
+    from ml.registry import current_models
+    from ml.train import read_training_frame, training_hash
+
+    fail_stale_jobs(restaurant_id)
+
+    current = current_models(restaurant_id, [menu_item for menu_item, _ in items])
+    unchanged = set()
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT DISTINCT menu_item
+            FROM training_jobs
+            WHERE restaurant_id = ?
+            AND status IN ('queued', 'running')
+        """, (restaurant_id,))
+        training = {row[0] for row in cur.fetchall()}
+
+    for menu_item, csv_path in items:
+        model = current.get(menu_item)
+
+        if menu_item in training:
+            continue
+
+        if model is None or not model["data_hash"] or not os.path.exists(model["path"]):
+            continue
+
+        backend = resolve_backend(restaurant_id, "" if layout == "global" else menu_item)
+
+        try:
+            df = read_training_frame(csv_path)
+        except Exception:
+            # Leave it to the training job to report what is wrong
+            continue
+
+        if training_hash(df, backend, layout) == model["data_hash"]:
+            unchanged.add(menu_item)
+
+    return unchanged
+
+
+def run_job(job_id, restaurant_id, menu_item, csv_path):
+    # Runs inside a pool worker
+    from ml.train import train_and_save
+
+    started = time.time()
+    _start([job_id])
+
+    try:
+        train_and_save(
+            menu_item=menu_item,
+            csv_path=csv_path,
+            output_dir=f"ml/storage/user_{restaurant_id}/{menu_item}",
+            restaurant_id=restaurant_id
+        )
+    except Exception as e:
+        _finish([job_id], "failed", time.time() - started, str(e))
+        return
+
+    _finish([job_id], "done", time.time() - started)
+    _collect_garbage(restaurant_id)
+
+
+def run_global_job(job_ids, restaurant_id, sources):
+    # Runs inside a pool worker; every job of the batch shares the outcome
+    from ml.train import train_global
+
+    started = time.time()
+    _start(job_ids)
+
+    try:
+        train_global(restaurant_id, sources)
+    except Exception as e:
+        _finish(job_ids, "failed", time.time() - started, str(e))
+        return
+
+    _finish(job_ids, "done", time.time() - started)
+    _collect_garbage(restaurant_id)
+
+
+def _collect_garbage(restaurant_id):
+    # Still in the pool worker, after the job is reported done: old
+    # model versions are cleared off the request path, and a failure
+    # here only leaves them for the next run
+    from ml.registry import collect_garbage
+
+    try:
+        collect_garbage(restaurant_id)
+    except Exception:
+        pass
+
+
+def _start(job_ids):
+    with get_db() as con:
+        con.executemany("""
+            UPDATE training_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(job_id,) for job_id in job_ids])
+        con.commit()
+
+
+def _finish(job_ids, status, duration, error=None):
+    with get_db() as con:
+        con.executemany("""
+            UPDATE training_jobs
+            SET status = ?, error = ?, duration_seconds = ?,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, [(status, error, round(duration, 3), job_id) for job_id in job_ids])
+        con.commit()
+
+
+def _fail(job_ids, error):
+    # Only jobs nobody has finished yet
+    with get_db() as con:
+        con.executemany("""
+            UPDATE training_jobs
+            SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('queued', 'running')
+        """, [(error, job_id) for job_id in job_ids])
+        con.commit()
+
+
+def _on_done(job_ids, future):
+    # The run_* functions record their own outcome; this only catches
+    # workers that died before they could (e.g. killed, or a broken pool)
+    if future.cancelled() or future.exception() is not None:
+        _fail(job_ids, "Training worker exited unexpectedly")
+
+
+def fail_stale_jobs(restaurant_id=None, max_age=STALE_JOB_SECONDS):
+    """
+    Mark jobs failed that have been queued or running for more than
+    max_age seconds, for restaurant_id or every restaurant. Their
+    worker is gone (a crash, a restart), so they would otherwise stay
+    pending for good. max_age=0 fails every unfinished job, which is
+    right at startup, before any worker exists. Returns the number
+    failed.
+    """
+    with get_db() as con:
+        cur = con.execute("""
+            UPDATE training_jobs
+            SET status = 'failed',
+                error = 'Training was interrupted',
+                finished_at = CURRENT_TIMESTAMP
+            WHERE status IN ('queued', 'running')
+            AND (? IS NULL OR restaurant_id = ?)
+            AND COALESCE(started_at, queued_at) <= datetime('now', ?)
+        """, (restaurant_id, restaurant_id, f"-{max_age} seconds"))
+        con.commit()
+
+    return cur.rowcount
+
+
+def job_status(restaurant_id, batch_id=None):
+    fail_stale_jobs(restaurant_id)
+
+    query = """
+        SELECT id, batch_id, menu_item, status, error,
+               queued_at, started_at, finished_at, duration_seconds
+        FROM training_jobs
+        WHERE restaurant_id = ?
+    """
+    params = [restaurant_id]
+
+    if batch_id:
+        query += " AND batch_id = ?"
+        params.append(batch_id)
+
+    query += " ORDER BY id DESC LIMIT 100"
+
+    with get_db() as con:
+        cur = con.cursor()
+        cur.row_factory = sqlite3.Row
+        jobs = [dict(row) for row in cur.execute(query, params)]
+
+    return {
+        "jobs": jobs,
+        "pending": sum(job["status"] in ("queued", "running") for job in jobs),
+        "retrained": sum(job["status"] == "done" for job in jobs),
+        "reused": sum(job["status"] == "reused" for job in jobs),
+        "failed": sum(job["status"] == "failed" for job in jobs)
+    }
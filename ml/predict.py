@@ -1,7 +1,26 @@
-import os
-import joblib
+import sqlite3
 import time
 
+from metrics import timed
+from ml.cache import model_cache, result_cache
+from ml.encoding import UNKNOWN_POLICY
+from ml.features import FEATURES
+from ml.registry import current_model, current_models
+
+
+def load_bundle(model):
+    """
+    Loaded bundle for a registry row. A restaurant-wide model is cached
+    once, not once per item it serves.
+    """
+    if model["layout"] == "global":
+        key = (model["restaurant_id"], "__global__")
+    else:
+        key = (model["restaurant_id"], model["menu_item"])
+
+    return model_cache.get(key, model["path"])
+
+
 def predict_demand(restaurant_id, menu_item, features):
     """
     restaurant_id : int
@@ -15,50 +34,167 @@ def predict_demand(restaurant_id, menu_item, features):
         - sales_last_30d_avg
     """
 
-    model_path = f"ml/storage/user_{restaurant_id}/{menu_item}/model.pkl"
+    # Load trained model + encoders (cached until the file changes)
+    model_row = current_model(restaurant_id, menu_item)
+
+    # The same inputs to the same model give the same answer
+    try:
+        key = (restaurant_id, menu_item, model_row["id"], result_key(features)) if model_row else None
+    except (KeyError, TypeError, ValueError):
+        key = None
+
+    demand = result_cache.get(key) if key else None
+    if demand is not None:
+        return prediction_result(menu_item, demand)
+
+    bundle = load_bundle(model_row) if model_row else None
 
-    if not os.path.exists(model_path):
+    if bundle is None:
         return {
             "error": "This menu item has not been trained yet."
         }
 
-    # Load trained model + encoders
-    bundle = joblib.load(model_path)
     model = bundle["model"]
     encoders = bundle["encoders"]
+    values = dict(features, menu_item=menu_item)
 
+    # Prepare input in SAME ORDER as training; categories are plain
+    # dict lookups
     try:
-        day_encoded = encoders["day_of_week"].transform(
-            [features["day_of_week"]]
-        )[0]
-
-        meal_encoded = encoders["meal_period"].transform(
-            [features["meal_period"]]
-        )[0]
-
-        weather_encoded = encoders["weather"].transform(
-            [features["weather"]]
-        )[0]
+        with timed("encode"):
+            X = [[
+                encoders[col].code(values[col])
+                if col in encoders else float(values[col])
+                for col in bundle.get("features", FEATURES)
+            ]]
 
     except Exception:
         return {
             "error": "Invalid input values for prediction."
         }
 
-    # Prepare input in SAME ORDER as training
-    X = [[
-        day_encoded,
-        meal_encoded,
+    with timed("model_predict"):
+        predicted_servings = int(model.predict(X)[0])
+
+    if key:
+        result_cache.put(key, predicted_servings)
+
+    return prediction_result(menu_item, predicted_servings)
+
+
+def result_key(features):
+    # Normalized so "25" and 25.0 are the same request
+    return (
+        str(features["day_of_week"]),
+        str(features["meal_period"]),
         int(features["is_holiday"]),
-        weather_encoded,
+        str(features["weather"]),
         float(features["temperature"]),
         float(features["sales_last_30d_avg"])
-    ]]
+    )
 
-    predicted_servings = int(model.predict(X)[0])
 
+def prediction_result(menu_item, demand):
     return {
         "id": f"{menu_item}_{int(time.time())}",
         "menu_item": menu_item,
-        "demand": predicted_servings
+        "demand": demand
     }
+
+
+def predict_batch(restaurant_id, rows, unknown=UNKNOWN_POLICY):
+    """
+    restaurant_id : int
+    rows          : list of dicts, each with menu_item plus the same
+                    feature keys as predict_demand. Extra keys (e.g. date)
+                    are passed through to the output.
+
+    Rows are grouped by the model artifact serving them, so every model
+    is loaded once and predicts its whole group as a single matrix, and
+    each categorical column is encoded with one lookup-table map.
+    unknown is the policy for categories the model never saw (see
+    ml.encoding). Returns a DataFrame in input order with a demand
+    column, and an error column set for rows that could not be
+    predicted.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    df["demand"] = pd.array([None] * len(df), dtype="Int64")
+    df["error"] = None
+
+    if df.empty:
+        return df
+
+    models = current_models(restaurant_id, df["menu_item"].unique())
+    paths = df["menu_item"].map(lambda m: models[m]["path"] if m in models else None)
+
+    df.loc[paths.isna(), "error"] = "This menu item has not been trained yet."
+
+    # One group per artifact: a restaurant-wide model predicts every
+    # item it serves in a single call
+    for _, group in df[paths.notna()].groupby(paths[paths.notna()], sort=False):
+        bundle = load_bundle(models[group["menu_item"].iloc[0]])
+
+        if bundle is None:
+            df.loc[group.index, "error"] = "This menu item has not been trained yet."
+            continue
+
+        encoders = bundle["encoders"]
+        features = bundle.get("features", FEATURES)
+
+        X = np.zeros((len(group), len(features)))
+        valid = np.ones(len(group), dtype=bool)
+
+        with timed("encode"):
+            for j, col in enumerate(features):
+                if col in encoders:
+                    values = encoders[col].encode(group[col], unknown)
+                else:
+                    values = pd.to_numeric(group[col], errors="coerce").to_numpy(dtype=float)
+
+                known = ~np.isnan(values)
+                X[known, j] = values[known]
+
+                valid &= known
+
+        if valid.any():
+            with timed("model_predict"):
+                predicted = bundle["model"].predict(X[valid])
+            df.loc[group.index[valid], "demand"] = predicted.astype(int)
+
+        df.loc[group.index[~valid], "error"] = "Invalid input values for prediction."
+
+    return df
+
+
+def warm_up(limit):
+    """
+    Load the `limit` most predicted current models into the model cache,
+    along with the libraries that serve them. Meant for the server's
+    master process before it forks (e.g. gunicorn --preload), so every
+    worker starts with them loaded and shares the memory copy-on-write.
+    Returns the number of models loaded.
+    """
+    import pandas  # noqa: F401
+
+    from db import get_db
+
+    with get_db() as con:
+        cur = con.cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("""
+            SELECT m.*
+            FROM models m
+            LEFT JOIN predictions p
+                ON p.restaurant_id = m.restaurant_id
+                AND p.menu_item = m.menu_item
+            WHERE m.status = 'ready'
+            GROUP BY m.id
+            ORDER BY COUNT(p.id) DESC, m.trained_at DESC
+            LIMIT ?
+        """, (limit,))
+        rows = [dict(row) for row in cur.fetchall()]
+
+    return sum(load_bundle(row) is not None for row in rows)
@@ -0,0 +1,234 @@
+import glob
+import json
+import os
+import sqlite3
+
+from db import get_db
+from ml.artifact import MANIFEST, artifact_size, remove_old_versions
+
+
+def register_model(restaurant_id, menu_item, path, trained_at, rows_used,
+                   train_seconds, source_path=None, backend=None, data_hash=None):
+    """
+    Record a finished per-item model and make it the item's current
+    version. Returns the new version number.
+    """
+    versions = register_models(
+        restaurant_id,
+        {menu_item: source_path},
+        path,
+        trained_at,
+        rows_used,
+        train_seconds,
+        backend=backend,
+        data_hashes={menu_item: data_hash}
+    )
+    return versions[menu_item]
+
+
+def register_models(restaurant_id, sources, path, trained_at, rows_used,
+                    train_seconds, backend=None, layout="per_item",
+                    data_hashes=None):
+    """
+    Make the artifact at path the current model for every item in
+    sources ({menu_item: source csv}); a global model serves many items.
+    data_hashes ({menu_item: training_hash}) lets later uploads of the
+    same data skip retraining.
+
+    Superseding the old rows and inserting the new ones happen in a
+    single write transaction, so readers see either the old models or
+    the new ones, never a mix or neither. Returns {menu_item: version}.
+    """
+    size = artifact_size(path)
+    data_hashes = data_hashes or {}
+    versions = {}
+
+    con = get_db()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        for menu_item, source_path in sources.items():
+            cur = con.execute("""
+                SELECT COALESCE(MAX(version), 0) + 1
+                FROM models
+                WHERE restaurant_id = ?
+                AND menu_item = ?
+            """, (restaurant_id, menu_item))
+            version = cur.fetchone()[0]
+
+            con.execute("""
+                UPDATE models
+                SET status = 'superseded'
+                WHERE restaurant_id = ?
+                AND menu_item = ?
+                AND status = 'ready'
+            """, (restaurant_id, menu_item))
+
+            con.execute("""
+                INSERT INTO models
+                (restaurant_id, menu_item, version, path, trained_at, rows_used,
+                 train_seconds, size_bytes, source_path, backend, layout,
+                 data_hash, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'ready')
+            """, (
+                restaurant_id,
+                menu_item,
+                version,
+                path,
+                trained_at,
+                rows_used,
+                train_seconds,
+                size,
+                source_path,
+                backend,
+                layout,
+                data_hashes.get(menu_item)
+            ))
+            versions[menu_item] = version
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+    return versions
+
+
+def current_model(restaurant_id, menu_item):
+    with get_db() as con:
+        cur = con.cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("""
+            SELECT *
+            FROM models
+            WHERE restaurant_id = ?
+            AND status = 'ready'
+            AND menu_item = ?
+        """, (restaurant_id, menu_item))
+        row = cur.fetchone()
+
+    return dict(row) if row else None
+
+
+def current_models(restaurant_id, menu_items):
+    """
+    Current registry rows for several items in one query, as
+    {menu_item: row}. Items without a trained model are left out.
+    """
+    menu_items = list(menu_items)
+    if not menu_items:
+        return {}
+
+    placeholders = ", ".join("?" for _ in menu_items)
+
+    with get_db() as con:
+        cur = con.cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute(f"""
+            SELECT *
+            FROM models
+            WHERE restaurant_id = ?
+            AND status = 'ready'
+            AND menu_item IN ({placeholders})
+        """, (restaurant_id, *menu_items))
+        return {row["menu_item"]: dict(row) for row in cur.fetchall()}
+
+
+def training_sources(restaurant_id):
+    """
+    {menu_item: csv path} for every currently trained item, used to
+    rebuild a restaurant-wide model.
+    """
+    from sales import csv_path_for
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT menu_item, source_path
+            FROM models
+            WHERE restaurant_id = ?
+            AND status = 'ready'
+        """, (restaurant_id,))
+        rows = cur.fetchall()
+
+    return {
+        menu_item: source_path or csv_path_for(restaurant_id, menu_item)
+        for menu_item, source_path in rows
+    }
+
+
+def trained_menu_items(restaurant_id):
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT menu_item
+            FROM models
+            WHERE restaurant_id = ?
+            AND status = 'ready'
+            ORDER BY menu_item
+        """, (restaurant_id,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def backfill(storage="ml/storage"):
+    """
+    Register models trained before the registry existed. Only directories
+    holding a model (manifest.json, or a legacy model.pkl) and meta.json
+    are complete, anything else was interrupted mid-training and is
+    skipped.
+    """
+    count = 0
+
+    for model_dir in glob.glob(os.path.join(storage, "user_*", "*")):
+        # __global__ and friends are never trained before the registry
+        if os.path.basename(model_dir).startswith("__"):
+            continue
+
+        meta_path = os.path.join(model_dir, "meta.json")
+        path = os.path.join(model_dir, MANIFEST)
+
+        if not os.path.exists(path):
+            path = os.path.join(model_dir, "model.pkl")
+
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            continue
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        restaurant_id = int(os.path.basename(os.path.dirname(model_dir))[len("user_"):])
+
+        register_model(
+            restaurant_id=restaurant_id,
+            menu_item=os.path.basename(model_dir),
+            path=path,
+            trained_at=meta.get("trained_at"),
+            rows_used=meta.get("rows_used"),
+            train_seconds=None,
+            backend=meta.get("backend", "rf"),
+            data_hash=meta.get("data_hash")
+        )
+        count += 1
+
+    return count
+
+
+def collect_garbage(restaurant_id=None, storage="ml/storage"):
+    """
+    Remove the model versions nothing needs any more (see
+    ml.artifact.remove_old_versions) from every model home of
+    restaurant_id, or of every restaurant. Versions a 'ready' row points
+    at are always kept. Returns the number of directories removed.
+    """
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT DISTINCT path
+            FROM models
+            WHERE status = 'ready'
+            AND (? IS NULL OR restaurant_id = ?)
+        """, (restaurant_id, restaurant_id))
+        in_use = {os.path.abspath(os.path.dirname(row[0])) for row in cur.fetchall()}
+
+    pattern = "user_*" if restaurant_id is None else f"user_{restaurant_id}"
+    removed = 0
+
+    for model_home in glob.glob(os.path.join(storage, pattern, "*")):
+        removed += remove_old_versions(model_home, in_use)
+
+    return removed
@@ -1,60 +1,303 @@
 import pandas as pd
-import joblib
+import numpy as np
+import hashlib
 import json
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder
 from datetime import datetime, timezone
 import os
+import shutil
+import time
 
-def train_and_save(menu_item, csv_path, output_dir):
-    df = pd.read_csv(csv_path)
+from ml.artifact import (MANIFEST, ForestModel, grow_forest, latest_artifact_dir, load_artifact,
+                         publish, save_artifact, staging_dir)
+from ml.backends import BACKENDS, DEFAULT_BACKEND, make_estimator, resolve_backend
+from ml.encoding import LookupEncoder
+from ml.features import CATEGORICAL, FEATURES, GLOBAL_FEATURES, TARGET
 
+GLOBAL_MODEL_DIR = "__global__"
 
+# Appended sales update the existing model instead of refitting it on
+# the whole history (FF_INCREMENTAL_TRAINING=0 always refits)
+INCREMENTAL = os.environ.get("FF_INCREMENTAL_TRAINING", "1") != "0"
+
+# Most recent rows an incremental update trains on (at least the new ones)
+RECENT_ROWS = int(os.environ.get("FF_TRAIN_WINDOW", 365))
+
+def encode_training_frame(df, features):
     df.drop(columns=["Date"], inplace=True, errors="ignore")
 
 
     encoders = {}
 
-    for col in ["day_of_week", "meal_period", "weather"]:
-        le = LabelEncoder()
-        df[col] = le.fit_transform(df[col])
-        encoders[col] = le
-
-    X = df[
-        [
-            "day_of_week",
-            "meal_period",
-            "is_holiday",
-            "weather",
-            "temperature",
-            "sales_last_30d_avg"
-        ]
-    ]
-
-    y = df["no_of_servings"]
-
-    model = RandomForestRegressor(
-        n_estimators=200,
-        random_state=42
+    for col in features:
+        if col in CATEGORICAL or col == "menu_item":
+            encoder = LookupEncoder.fit(df[col])
+            df[col] = encoder.transform(df[col])
+            encoders[col] = encoder
+
+    X = df[features]
+
+    y = df[TARGET]
+
+    return X, y, encoders
+
+def read_training_frame(csv_path):
+    # Typed, validated and deduplicated rows, reduced to the columns a
+    # model sees in a fixed order; Date and any extra export columns
+    # cannot change the model
+    from sales import read_sales_csv
+
+    return read_sales_csv(csv_path)[FEATURES + [TARGET]]
+
+def training_hash(df, backend, layout="per_item"):
+    """
+    Fingerprint of a training run: the normalized rows plus the
+    estimator config. Equal hashes mean a retrain would rebuild the
+    model already on disk.
+    """
+    digest = hashlib.sha256()
+
+    config = {"columns": list(df.columns), "backend": BACKENDS[backend], "layout": layout}
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+def load_training_data(csv_path):
+    return encode_training_frame(read_training_frame(csv_path), FEATURES)
+
+def concat_item_frames(frames):
+    # {menu_item: frame} -> one frame with the item as a column
+    return pd.concat(
+        [df.assign(menu_item=menu_item) for menu_item, df in frames.items()],
+        ignore_index=True
     )
 
+def load_global_training_data(sources):
+    frames = {
+        menu_item: read_training_frame(csv_path)
+        for menu_item, csv_path in sources.items()
+    }
+    return encode_training_frame(concat_item_frames(frames), GLOBAL_FEATURES)
+
+def previous_rows(artifact_dir, df, backend):
+    """
+    How many rows the artifact in artifact_dir was trained on, when df
+    is that data with rows appended (same prefix hash, same backend).
+    None means the model has to be refit from scratch.
+    """
+    meta_path = os.path.join(artifact_dir, "meta.json")
+
+    if not (os.path.exists(meta_path) and os.path.exists(os.path.join(artifact_dir, MANIFEST))):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    seen = meta.get("rows_seen", meta.get("rows_used"))
+
+    if not meta.get("data_hash") or not seen or seen >= len(df):
+        return None
+
+    if training_hash(df.iloc[:seen], backend) != meta["data_hash"]:
+        return None
+
+    return seen
+
+def grown_encoders(encoders, df):
+    # Old vocabulary plus any category first seen in df
+    return {
+        col: LookupEncoder(
+            np.union1d(encoders[col].classes_, df[col].astype(str).unique()).tolist(),
+            encoders[col].most_frequent
+        )
+        for col in encoders
+    }
+
+def encode_with(df, encoders, features):
+    X = df[features].to_numpy(dtype=object)
+
+    for i, col in enumerate(features):
+        if col in encoders:
+            X[:, i] = encoders[col].transform(df[col])
+
+    return X.astype(float), df[TARGET].to_numpy()
+
+def update_model(output_dir, df, seen, backend, source_dir):
+    """
+    Fold the rows after `seen` into the model in source_dir, writing the
+    result to output_dir, at a cost that follows the new rows rather
+    than the whole history.
+
+    Forests get new trees fitted on the recent rows, replacing their
+    oldest trees so the forest keeps its configured size. Other backends
+    are refit on the recent window. Returns (manifest path, rows fitted,
+    mode).
+    """
+    bundle = load_artifact(os.path.join(source_dir, MANIFEST), mmap=False)
+    encoders = grown_encoders(bundle["encoders"], df.iloc[seen:])
+
+    window = df.iloc[-max(len(df) - seen, RECENT_ROWS):]
+    X, y = encode_with(window, encoders, FEATURES)
+
+    model = make_estimator(backend)
+
+    if isinstance(bundle["model"], ForestModel) and BACKENDS[backend]["estimator"] == "RandomForestRegressor":
+        size = BACKENDS[backend]["params"]["n_estimators"]
+
+        # New trees in proportion to the share of new rows
+        model.set_params(n_estimators=max(1, -(-size * (len(df) - seen) // len(df))))
+        model.fit(X, y)
+
+        return (
+            grow_forest(output_dir, model, encoders, max_trees=size, source_dir=source_dir),
+            len(X),
+            "warm_start"
+        )
+
     model.fit(X, y)
 
-    os.makedirs(output_dir, exist_ok=True)
+    return save_artifact(output_dir, model, encoders, FEATURES), len(X), "window"
 
-    joblib.dump(
-        {
-            "model": model,
-            "encoders": encoders
-        },
-        f"{output_dir}/model.pkl"
-    )
+def write_version(output_dir, write):
+    """
+    Run write(staging_dir), which saves an artifact and its meta.json
+    there, and publish the result as a new version in output_dir.
+    Returns the version's manifest path. A failed write leaves nothing
+    behind, and the versions already published are never touched.
+    """
+    staging = staging_dir(output_dir)
+
+    try:
+        write(staging)
+        return publish(staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def train_and_save(menu_item, csv_path, output_dir, restaurant_id=None, backend=None,
+                   incremental=INCREMENTAL):
+    """
+    Train menu_item's model and publish it as a new version in
+    output_dir, then (given restaurant_id) register it. Returns the
+    manifest path.
+    """
+    started = time.time()
+
+    df = read_training_frame(csv_path)
+
+    if backend is None:
+        backend = (
+            resolve_backend(restaurant_id, menu_item)
+            if restaurant_id is not None else DEFAULT_BACKEND
+        )
+
+    data_hash = training_hash(df, backend)
+
+    previous = latest_artifact_dir(output_dir) if incremental else None
+    seen = previous_rows(previous, df, backend) if previous else None
 
     meta = {
         "menu_item": menu_item,
+        "rows_seen": len(df),
+        "backend": backend,
+        "data_hash": data_hash
+    }
+
+    def write(staging):
+        if seen:
+            _, rows_used, mode = update_model(staging, df, seen, backend, previous)
+        else:
+            X, y, encoders = encode_training_frame(df, FEATURES)
+
+            model = make_estimator(backend)
+
+            # Plain arrays: predictions are made from matrices, not DataFrames
+            model.fit(X.to_numpy(), y.to_numpy())
+
+            save_artifact(staging, model, encoders, FEATURES)
+            rows_used, mode = len(X), "full"
+
+        meta.update(
+            trained_at=datetime.now(timezone.utc).isoformat(),
+            rows_used=rows_used,
+            mode=mode
+        )
+
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    model_path = write_version(output_dir, write)
+
+    # The model only becomes visible to the app once it is registered
+    if restaurant_id is not None:
+        from ml.registry import register_model
+
+        register_model(
+            restaurant_id=restaurant_id,
+            menu_item=menu_item,
+            path=model_path,
+            trained_at=meta["trained_at"],
+            rows_used=meta["rows_used"],
+            train_seconds=round(time.time() - started, 3),
+            source_path=csv_path,
+            backend=backend,
+            data_hash=data_hash
+        )
+
+    return model_path
+
+def train_global(restaurant_id, sources, backend=None):
+    """
+    One model for the whole restaurant, trained on every item's sales
+    with the item itself as an encoded feature.
+
+    sources : {menu_item: csv_path}
+    """
+    started = time.time()
+
+    frames = {
+        menu_item: read_training_frame(csv_path)
+        for menu_item, csv_path in sources.items()
+    }
+
+    if backend is None:
+        backend = resolve_backend(restaurant_id, "")
+
+    data_hashes = {
+        menu_item: training_hash(df, backend, "global")
+        for menu_item, df in frames.items()
+    }
+
+    X, y, encoders = encode_training_frame(concat_item_frames(frames), GLOBAL_FEATURES)
+
+    model = make_estimator(backend)
+    model.fit(X.to_numpy(), y.to_numpy())
+
+    meta = {
+        "menu_items": sorted(sources),
         "trained_at": datetime.now(timezone.utc).isoformat(),
-        "rows_used": len(df)
+        "rows_used": len(X),
+        "backend": backend
     }
 
-    with open(f"{output_dir}/meta.json", "w") as f:
-        json.dump(meta, f)
+    def write(staging):
+        save_artifact(staging, model, encoders, GLOBAL_FEATURES)
+
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    model_path = write_version(f"ml/storage/user_{restaurant_id}/{GLOBAL_MODEL_DIR}", write)
+
+    from ml.registry import register_models
+
+    register_models(
+        restaurant_id,
+        sources,
+        model_path,
+        trained_at=meta["trained_at"],
+        rows_used=meta["rows_used"],
+        train_seconds=round(time.time() - started, 3),
+        backend=backend,
+        layout="global",
+        data_hashes=data_hashes
+    )
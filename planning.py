@@ -0,0 +1,278 @@
+"""
+Bulk planning over a servings plan: a list of (menu_item, date,
+servings) rows, typed in by hand (items x days) or taken from the
+precomputed forecasts.
+
+The plan is sent to SQLite as one JSON parameter and joined against
+recipe_mapping (or staff_mapping) in a single query, so a week across
+the whole menu costs one statement, not one per item and day.
+"""
+import json
+from datetime import date, timedelta
+
+from db import get_db
+
+# unit -> (unit it is totalled in, factor); anything else is totalled
+# in its own unit, lower-cased
+UNITS = {
+    "mg": ("kg", 0.000001),
+    "g": ("kg", 0.001),
+    "gm": ("kg", 0.001),
+    "gms": ("kg", 0.001),
+    "gram": ("kg", 0.001),
+    "grams": ("kg", 0.001),
+    "kg": ("kg", 1),
+    "kgs": ("kg", 1),
+    "ml": ("l", 0.001),
+    "l": ("l", 1),
+    "ltr": ("l", 1),
+    "litre": ("l", 1),
+    "liter": ("l", 1),
+    "litres": ("l", 1),
+    "liters": ("l", 1),
+    "pc": ("pcs", 1),
+    "pcs": ("pcs", 1),
+    "piece": ("pcs", 1),
+    "pieces": ("pcs", 1),
+    "dozen": ("pcs", 12)
+}
+
+# Totals under one kg or litre are given in g or ml
+SMALL_UNITS = {
+    "kg": ("g", 1000),
+    "l": ("ml", 1000)
+}
+
+
+def _plan_json(plan):
+    return json.dumps([
+        [menu_item, str(day) if day is not None else None, float(servings)]
+        for menu_item, day, servings in plan
+    ])
+
+
+def grocery_plan(restaurant_id, plan, by_date=False):
+    """
+    plan    : list of (menu_item, date or None, servings)
+    by_date : also split the totals per date
+
+    Ingredients the plan needs, summed across items (and days unless
+    by_date): ingredient names are matched case-insensitively and
+    quantities converted to one unit per family (g -> kg, ml -> l);
+    a total under 1 kg or 1 l is given back in g or ml.
+    Returns {"ingredients": [{"ingredient", "unit", "required"
+    [, "date"]}], "missing_recipes": [menu_item, ...]}.
+    """
+    if not plan:
+        return {"ingredients": [], "missing_recipes": []}
+
+    date_column = "p.date," if by_date else ""
+
+    with get_db() as con:
+        # Summed per ingredient and unit as written; the few resulting
+        # rows are converted below, which is cheaper than converting
+        # every joined row in SQL
+        cur = con.execute(f"""
+            WITH plan(menu_item, date, servings) AS (
+                SELECT json_extract(value, '$[0]'),
+                       json_extract(value, '$[1]'),
+                       json_extract(value, '$[2]')
+                FROM json_each(?)
+            ),
+            planned AS (
+                SELECT menu_item, {"date," if by_date else ""} SUM(servings) AS servings
+                FROM plan
+                GROUP BY menu_item {", date" if by_date else ""}
+            )
+            SELECT {date_column}
+                   LOWER(TRIM(r.ingredient_name)) AS ingredient_key,
+                   MIN(TRIM(r.ingredient_name)),
+                   LOWER(TRIM(r.unit)) AS unit_key,
+                   SUM(r.qty_per_serving * p.servings)
+            FROM planned p
+            JOIN recipe_mapping r
+                ON r.restaurant_id = ?
+                AND r.menu_item = p.menu_item
+            GROUP BY {date_column} ingredient_key, unit_key
+        """, (_plan_json(plan), restaurant_id))
+
+        totals = {}
+        for row in cur.fetchall():
+            day, (key, name, unit, required) = (row[0], row[1:]) if by_date else (None, row)
+            unit, factor = UNITS.get(unit, (unit, 1))
+
+            total = totals.setdefault((day, key, unit), [name, 0])
+            total[0] = min(total[0], name)
+            total[1] += required * factor
+
+        cur = con.execute("""
+            SELECT DISTINCT value
+            FROM json_each(?)
+            WHERE value NOT IN (
+                SELECT menu_item
+                FROM recipe_mapping
+                WHERE restaurant_id = ?
+            )
+            ORDER BY value
+        """, (json.dumps(sorted({menu_item for menu_item, _, _ in plan})), restaurant_id))
+        missing = [row[0] for row in cur.fetchall()]
+
+    ingredients = []
+    for (day, _, unit), (name, required) in sorted(totals.items(), key=lambda t: (t[0][0] or "", *t[0][1:])):
+        if unit in SMALL_UNITS and required < 1:
+            unit, scale = SMALL_UNITS[unit]
+            required *= scale
+
+        ingredient = {"ingredient": name, "unit": unit, "required": round(required, 3)}
+        if by_date:
+            ingredient["date"] = day
+        ingredients.append(ingredient)
+
+    return {"ingredients": ingredients, "missing_recipes": missing}
+
+
+def staff_plan(restaurant_id, items, pooled=False):
+    """
+    items  : list of (menu_item, servings), e.g. a meal period's menu
+    pooled : total the shift's fractional staff before rounding, so
+             three items needing 0.4 cooks each share one cook instead
+             of getting none
+
+    Every item's staff configuration is read in one query and scaled
+    for all items at once. Returns {"items": [...], "totals": {...},
+    "pooled": pooled}: items in input order holding {"menu_item",
+    "servings", "cooks", "helpers", "cleaners"}, or None for an item
+    without a configuration; totals are the shift's cooks, helpers and
+    cleaners.
+    """
+    import numpy as np
+
+    with get_db() as con:
+        cur = con.execute("""
+            SELECT menu_item, base_servings, cooks, helpers, cleaners
+            FROM staff_mapping
+            WHERE restaurant_id = ?
+            AND menu_item IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        """, (restaurant_id, json.dumps(sorted({menu_item for menu_item, _ in items}))))
+
+        configs = {}
+        for menu_item, *config in cur.fetchall():
+            configs.setdefault(menu_item, config)
+
+    found = [i for i, (menu_item, _) in enumerate(items) if menu_item in configs]
+
+    config = np.array([configs[items[i][0]] for i in found], dtype=float).reshape(-1, 4)
+    servings = np.array([items[i][1] for i in found], dtype=float)
+
+    # Staff per role scales with servings over the configured base
+    base = config[:, 0]
+    multiplier = np.divide(servings, base, out=np.zeros_like(servings), where=base != 0)
+    needed = config[:, 1:] * multiplier[:, None]
+
+    # np.round rounds halves to even, like round() did per item
+    per_item = np.round(needed).astype(int)
+    totals = np.round(needed.sum(axis=0)).astype(int) if pooled else per_item.sum(axis=0)
+
+    results = [None] * len(items)
+    for i, (cooks, helpers, cleaners) in zip(found, per_item.tolist()):
+        results[i] = {
+            "menu_item": items[i][0],
+            "servings": items[i][1],
+            "cooks": cooks,
+            "helpers": helpers,
+            "cleaners": cleaners
+        }
+
+    return {
+        "items": results,
+        "totals": dict(zip(("cooks", "helpers", "cleaners"), totals.tolist())),
+        "pooled": pooled
+    }
+
+
+def record_staff_plan(restaurant_id, results):
+    """
+    Store staff_plan() item results in the staff history, in one
+    transaction.
+    """
+    with get_db() as con:
+        con.executemany("""
+            INSERT INTO staff_predictions
+            (restaurant_id, menu_item, predicted_servings, cooks, helpers, cleaners)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (restaurant_id, r["menu_item"], r["servings"], r["cooks"], r["helpers"], r["cleaners"])
+            for r in results
+            if r is not None
+        ])
+        con.commit()
+
+
+def forecast_plan(restaurant_id, start=None, days=7, meal_period=None):
+    """
+    Servings plan from the precomputed forecasts: (menu_item, date,
+    servings) summed over meal periods (or for just meal_period), for
+    `days` days from start (default today). Forecasts missing for an
+    upcoming range are computed first.
+
+    Raises ValueError for a range ending past the forecast horizon
+    (FORECAST_DAYS from today): computing those would cost a request
+    time and rows in proportion to how far out it asks.
+    """
+    from ml.forecast import FORECAST_DAYS, forecast_restaurant
+
+    today = date.today()
+    start = start or today
+    end = start + timedelta(days=days)
+
+    if days < 1:
+        raise ValueError("days must be at least 1")
+
+    if end > today + timedelta(days=FORECAST_DAYS):
+        raise ValueError(f"Forecasts only cover the next {FORECAST_DAYS} days")
+
+    def read():
+        with get_db() as con:
+            cur = con.execute("""
+                SELECT f.menu_item, f.date, SUM(f.demand)
+                FROM forecast_cache f
+                JOIN models m
+                    ON m.restaurant_id = f.restaurant_id
+                    AND m.menu_item = f.menu_item
+                    AND m.status = 'ready'
+                    AND m.version = f.model_version
+                WHERE f.restaurant_id = ?
+                AND f.date >= ?
+                AND f.date < ?
+                AND (? IS NULL OR f.meal_period = ?)
+                GROUP BY f.menu_item, f.date
+                ORDER BY f.date, f.menu_item
+            """, (restaurant_id, start.isoformat(), end.isoformat(), meal_period, meal_period))
+            return cur.fetchall()
+
+    def covered(first):
+        # Days forecast for any meal period: a meal period the restaurant
+        # never sells has no rows however fresh the cache is
+        with get_db() as con:
+            cur = con.execute("""
+                SELECT COUNT(DISTINCT f.date)
+                FROM forecast_cache f
+                JOIN models m
+                    ON m.restaurant_id = f.restaurant_id
+                    AND m.menu_item = f.menu_item
+                    AND m.status = 'ready'
+                    AND m.version = f.model_version
+                WHERE f.restaurant_id = ?
+                AND f.date >= ?
+                AND f.date < ?
+            """, (restaurant_id, first.isoformat(), end.isoformat()))
+            return cur.fetchone()[0]
+
+    # Only today onwards can be forecast
+    first = max(start, today)
+    upcoming = (end - first).days
+    if upcoming > 0 and covered(first) < upcoming:
+        forecast_restaurant(restaurant_id, FORECAST_DAYS)
+
+    return read()
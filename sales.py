@@ -0,0 +1,192 @@
+import os
+
+from werkzeug.utils import secure_filename
+
+# Uploads are read this many rows at a time, so ingesting a multi-year
+# export never holds more than one chunk of raw rows in memory
+CHUNK_ROWS = int(os.environ.get("FF_INGEST_CHUNK_ROWS", 50000))
+
+# Column -> dtype for a sales export. Flags and numbers are read as
+# float32 so missing values survive parsing and can be rejected per row
+SALES_DTYPES = {
+    "Date": "string",
+    "day_of_week": "category",
+    "meal_period": "category",
+    "is_holiday": "float32",
+    "weather": "category",
+    "temperature": "float32",
+    "sales_last_30d_avg": "float32",
+    "no_of_servings": "float32"
+}
+
+# One sale row per date and meal period; a repeated row replaces the
+# earlier one
+SALES_KEY = ["Date", "meal_period"]
+
+
+class SalesFileError(ValueError):
+    pass
+
+
+def csv_path_for(restaurant_id, menu_item):
+    filename = secure_filename(menu_item.lower().replace(" ", "_") + ".csv")
+    return os.path.join(f"uploads/user_{restaurant_id}", filename)
+
+
+def read_sales_chunks(csv_path, chunk_rows=CHUNK_ROWS):
+    """
+    Yield typed, validated chunks of a sales CSV: categoricals for the
+    text columns, an int8 holiday flag, float32 numbers and a parsed
+    Date. Rows that fail validation are dropped; repeats within a chunk
+    keep their last occurrence.
+    """
+    import pandas as pd
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    missing = [col for col in SALES_DTYPES if col not in header]
+
+    if missing:
+        raise SalesFileError(f"Sales CSV is missing column(s): {', '.join(missing)}")
+
+    reader = pd.read_csv(
+        csv_path,
+        usecols=list(SALES_DTYPES),
+        dtype=SALES_DTYPES,
+        chunksize=chunk_rows
+    )
+
+    for chunk in reader:
+        chunk["Date"] = pd.to_datetime(chunk["Date"], format="%d-%m-%Y", errors="coerce")
+
+        valid = (
+            chunk.notna().all(axis=1)
+            & chunk["is_holiday"].isin([0, 1])
+            & (chunk["no_of_servings"] >= 0)
+        )
+        chunk = chunk[valid].drop_duplicates(subset=SALES_KEY, keep="last")
+
+        yield chunk.astype({"is_holiday": "int8"})
+
+
+def read_sales_csv(csv_path):
+    """
+    Whole sales CSV as one typed frame, in file order, with repeated
+    rows deduplicated across chunks.
+    """
+    import pandas as pd
+
+    chunks = [chunk for chunk in read_sales_chunks(csv_path) if len(chunk)]
+
+    if not chunks:
+        raise SalesFileError("Sales CSV has no valid rows")
+
+    df = pd.concat(chunks, ignore_index=True)
+    df = df.drop_duplicates(subset=SALES_KEY, keep="last").reset_index(drop=True)
+
+    # Chunks carry their own categories; concat falls back to objects
+    categorical = [col for col, dtype in SALES_DTYPES.items() if dtype == "category"]
+    return df.astype({col: "category" for col in categorical})
+
+
+def ingest_sales_csv(con, restaurant_id, menu_item, csv_path):
+    """
+    Stream an uploaded sales CSV into sales_history, one row per date and
+    meal period.
+
+    Replaces whatever history was stored for the item, since every
+    upload is the item's full sales export. Raises SalesFileError, and
+    keeps the stored history, for a CSV without the expected columns or
+    without a single valid row. Returns the number of days stored.
+    """
+    rows = read_sales_chunks(csv_path)
+
+    con.execute("""
+        DELETE FROM sales_history
+        WHERE restaurant_id = ?
+        AND menu_item = ?
+    """, (restaurant_id, menu_item))
+
+    try:
+        for chunk in rows:
+            con.executemany("""
+                INSERT INTO sales_history
+                (restaurant_id, menu_item, date, meal_period, day_of_week,
+                 is_holiday, weather, temperature, sales_last_30d_avg, servings)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (restaurant_id, menu_item, date, meal_period)
+                DO UPDATE SET
+                    day_of_week = excluded.day_of_week,
+                    is_holiday = excluded.is_holiday,
+                    weather = excluded.weather,
+                    temperature = excluded.temperature,
+                    sales_last_30d_avg = excluded.sales_last_30d_avg,
+                    servings = excluded.servings
+            """, (
+                (restaurant_id, menu_item, date, meal_period, day_of_week,
+                 int(is_holiday), weather, float(temperature), float(avg), float(servings))
+                for date, meal_period, day_of_week, is_holiday, weather,
+                    temperature, avg, servings in zip(
+                        chunk["Date"].dt.strftime("%Y-%m-%d"),
+                        chunk["meal_period"].astype(str),
+                        chunk["day_of_week"].astype(str),
+                        chunk["is_holiday"],
+                        chunk["weather"].astype(str),
+                        chunk["temperature"],
+                        chunk["sales_last_30d_avg"],
+                        chunk["no_of_servings"]
+                    )
+            ))
+    except Exception:
+        con.rollback()
+        raise
+
+    days = con.execute("""
+        SELECT COUNT(DISTINCT date)
+        FROM sales_history
+        WHERE restaurant_id = ?
+        AND menu_item = ?
+    """, (restaurant_id, menu_item)).fetchone()[0]
+
+    if days == 0:
+        con.rollback()
+        raise SalesFileError("Sales CSV has no valid rows")
+
+    con.commit()
+
+    return days
+
+
+def last_30d_avg(con, restaurant_id, menu_item):
+    """
+    Average servings over the item's 30 most recent sales rows (one row
+    per date and meal period), as the model was trained with, or None if
+    no history has been ingested. Read backwards off the primary key.
+    """
+    cur = con.execute("""
+        SELECT AVG(servings)
+        FROM (
+            SELECT servings
+            FROM sales_history
+            WHERE restaurant_id = ?
+            AND menu_item = ?
+            ORDER BY date DESC, meal_period DESC
+            LIMIT 30
+        )
+    """, (restaurant_id, menu_item))
+
+    return cur.fetchone()[0]
+
+
+def ensure_ingested(con, restaurant_id, menu_item):
+    """
+    Ingest an item's CSV if it was uploaded before sales_history existed.
+    """
+    path = csv_path_for(restaurant_id, menu_item)
+
+    if not os.path.exists(path):
+        return False
+
+    try:
+        return ingest_sales_csv(con, restaurant_id, menu_item, path) > 0
+    except SalesFileError:
+        return False